@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 import os
+import sys
 import s3fs
+import atexit
 import inspect
 import subprocess as sp
 from os import getpid
@@ -10,6 +12,10 @@ from functools import wraps
 from random import shuffle
 from nibabel.streamlines import S3TrkFile, TrkFile
 
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src import trk
+from src.readahead import PrefetchFile
+
 ex_path = "s3://hydi-tractography/hydi_tracks.12_58_7.trk"
 tmpfs = "/dev/shm"
 disk = "/home/ec2-user/"
@@ -28,6 +34,28 @@ def setup_bench(file=None):
         print(inspect.cleandoc(out_string))
 
 
+# rows are buffered and written outside of the timed sections
+bench_rows = []
+
+
+def flush_bench():
+    global bench_rows
+    rows, bench_rows = bench_rows, []
+
+    for bfile, fname, runtime, rep in rows:
+        try:
+            with open(bfile, "a+") as f:
+                f.write(f"{fname},{runtime},{rep}\n")
+        except Exception as e:
+            out_string = f"""
+            {fname}\t{runtime}\t{rep}
+            """
+            print(inspect.cleandoc(out_string))
+
+
+atexit.register(flush_bench)
+
+
 # decorator
 def benchmark(func):
     @wraps(func)
@@ -38,16 +66,7 @@ def benchmark(func):
             return func(*args, **kwargs)
         finally:
             end = perf_counter()
-            try:
-                with open(kwargs["bfile"], "a+") as f:
-                    f.write(
-                        f"{kwargs['fname']},{end - start},{kwargs['rep']}\n"
-                    )
-            except Exception as e:
-                out_string = f"""
-                {kwargs['fname']}\t{(end-start)}\t{kwargs['rep']}
-                """
-                print(inspect.cleandoc(out_string))
+            bench_rows.append((kwargs["bfile"], kwargs["fname"], end - start, kwargs["rep"]))
 
     return _benchmark
 
@@ -74,6 +93,15 @@ def read_trk(f, lazy, fetch=False, **kwargs):
     for sl in streamlines:
         s = sl
 
+@benchmark
+def stream_trk(fs, filename, **kwargs):
+    # header first, then records decoded in batches from pipelined ranged reads
+    header = trk.read_header(fs, filename)
+
+    for batch in trk.iter_batches(fs, filename, header=header):
+        for i in range(len(batch.offsets) - 1):
+            s = batch.points[batch.offsets[i] : batch.offsets[i + 1]]
+
 @benchmark
 def copy_local(filename, mem_path, **kwargs):
     fs = s3fs.S3FileSystem()
@@ -95,6 +123,7 @@ def read_local(filename, path, lazy=True, bfile=None, rep=0, fname="read_me"):
     with open(local_path, 'rb') as f:
         read_trk(f, lazy, fname=fname, bfile=bfile, rep=rep)
 
+    flush_bench()
     cleanup(os.path.basename(filename))
 
 
@@ -110,6 +139,7 @@ def read_pf(filename, lazy=True, caches={"/dev/shm": 7*1024}, prefetch_size=32*1
         mb=fname.split("_")[-1]
         os.rename(pf_fn, bfile.replace("benchmarks.out", f"rep{rep}-{pf_fn}-{mb}"))
 
+    flush_bench()
     cleanup(os.path.basename(filename))
 
 
@@ -120,13 +150,35 @@ def read_s3(filename, lazy=True, bfile=None, rep=0, fname="read_s3", **s3_kwargs
     with fs.open(filename, 'rb', **s3_kwargs) as f:
         read_trk(f, lazy, fname=fname, bfile=bfile, rep=rep)
 
+    flush_bench()
     cleanup(os.path.basename(filename))
 
 
+def read_ra(filename, lazy=True, bfile=None, rep=0, fname="read_ra"):
+    drop_caches()
+
+    # block size and readahead window adapt while the streamlines are read
+    fs = s3fs.S3FileSystem()
+    with PrefetchFile(fs, filename) as f:
+        read_trk(f, lazy, fname=fname, bfile=bfile, rep=rep)
+
+    print(f"Readahead stats: {f.stats}, final block size {f.block_size}")
+    flush_bench()
+
+
+def read_stream(filename, bfile=None, rep=0, fname="read_st"):
+    drop_caches()
+
+    fs = s3fs.S3FileSystem()
+    stream_trk(fs, filename, fname=fname, bfile=bfile, rep=rep)
+
+    flush_bench()
+
+
 def read_all():
     bfile = os.path.join("results", f"read-all-{strftime('%Y%m%d-%H%M%S')}-benchmarks.out")
 
-    experiments = ["mem", "disk", "pf", "s3"]
+    experiments = ["mem", "disk", "pf", "s3", "ra", "st"]
     shuffle(experiments)
 
     for i in range(reps):
@@ -138,6 +190,10 @@ def read_all():
                 read_local(ex_path, path=disk, bfile=bfile, rep=i, fname="read_di")
             elif e == "pf":
                 read_pf(ex_path, bfile=bfile, rep=i)
+            elif e == "ra":
+                read_ra(ex_path, bfile=bfile, rep=i)
+            elif e == "st":
+                read_stream(ex_path, bfile=bfile, rep=i)
             else:
                 read_s3(ex_path, bfile=bfile, rep=i)
 
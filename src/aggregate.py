@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+import csv
+import click
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from os import makedirs, walk, path as op
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# one row per benchmarked call, paired from its start and end rows
+stage_dtype = [
+    ("instance", "U64"),
+    ("condition", "U64"),
+    ("rep", "i4"),
+    ("bench", "U128"),
+    ("stage", "U64"),
+    ("file", "U256"),
+    ("pid", "i8"),
+    ("start", "i8"),
+    ("end", "i8"),
+    ("duration", "f8"),
+    ("bytes_in", "f8"),
+    ("bytes_out", "f8"),
+]
+
+# one row per experiment: makespans, launch_exp .out and .bench timings
+run_dtype = [
+    ("instance", "U64"),
+    ("condition", "U64"),
+    ("rep", "i4"),
+    ("bench", "U128"),
+    ("duration", "f8"),
+]
+
+group_default = ("instance", "condition", "bench", "stage")
+percentiles = (5, 25, 50, 75, 95)
+
+
+def partition(root, fp):
+    # results/<instance>/<condition>/rep-N/<file>, any level may be missing
+    parts = op.relpath(op.dirname(fp), root).split(op.sep)
+    parts = [p for p in parts if p != "."]
+
+    rep = -1
+    if len(parts) > 0 and parts[-1].startswith("rep-"):
+        rep = int(parts.pop()[4:])
+
+    instance = parts[0] if len(parts) > 0 else ""
+    condition = "/".join(parts[1:])
+    return instance, condition, rep
+
+
+def _float(value):
+    return float(value) if value not in ("", None) else np.nan
+
+
+def pair_rows(rows):
+    # k-th start and k-th end of the same stage, file, pid and thread form a call
+    if len(rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    keys = np.array(
+        ["\0".join([r[0].rsplit("_", 1)[0], r[1], r[3], r[5] if len(r) > 5 else ""]) for r in rows]
+    )
+    is_end = np.array([r[0].endswith("_end") for r in rows])
+    timestamps = np.array([int(r[2]) for r in rows], dtype=np.int64)
+    _, codes = np.unique(keys, return_inverse=True)
+
+    order = np.lexsort((timestamps, codes))
+    starts = order[~is_end[order]]
+    ends = order[is_end[order]]
+
+    # drop calls that did not complete, so both sides line up group by group
+    n_groups = codes.max() + 1
+    n_starts = np.bincount(codes[starts], minlength=n_groups)
+    n_ends = np.bincount(codes[ends], minlength=n_groups)
+    n_pairs = np.minimum(n_starts, n_ends)
+
+    def _keep(idx, counts):
+        first = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        rank = np.arange(len(idx)) - first[codes[idx]]
+        return idx[rank < n_pairs[codes[idx]]]
+
+    return _keep(starts, n_starts), _keep(ends, n_ends)
+
+
+def parse_benchmark(fp, instance, condition, rep):
+    with open(fp) as f:
+        rows = [r for r in csv.reader(f)][1:]
+    rows = [r for r in rows if len(r) >= 5 and r[0].endswith(("_start", "_end"))]
+
+    starts, ends = pair_rows(rows)
+    out = np.empty(len(starts), dtype=stage_dtype)
+    bench = op.basename(fp)
+
+    for i, (s, e) in enumerate(zip(starts, ends)):
+        start, end = rows[s], rows[e]
+        out[i] = (
+            instance,
+            condition,
+            rep,
+            bench,
+            start[0].rsplit("_", 1)[0],
+            start[1],
+            int(start[3]),
+            int(start[2]),
+            int(end[2]),
+            _float(end[4]),
+            _float(end[6]) if len(end) > 7 else np.nan,
+            _float(end[7]) if len(end) > 7 else np.nan,
+        )
+
+    return out
+
+
+def parse_runs(fp, instance, condition, rep, kind):
+    runs = []
+    with open(fp) as f:
+        rows = list(csv.reader(f))
+
+    if kind == "makespan":
+        # bench,start,end,duration
+        runs = [(r[0], rep, float(r[3])) for r in rows if len(r) == 4]
+    elif kind == "out":
+        # launch_exp.py: experiment,runtime,repetition
+        runs = [(r[0], int(r[2]), float(r[1])) for r in rows if len(r) == 3]
+    elif kind == "bench":
+        # repetition,size,real,user,system
+        stem = op.splitext(op.basename(fp))[0]
+        runs = [(f"{stem}_{r[1]}", int(r[0]), float(r[2])) for r in rows[1:] if len(r) >= 3]
+
+    out = np.empty(len(runs), dtype=run_dtype)
+    for i, (bench, r, duration) in enumerate(runs):
+        out[i] = (instance, condition, r, bench, duration)
+    return out
+
+
+def parse_file(args):
+    root, fp = args
+    instance, condition, rep = partition(root, fp)
+    empty = np.empty(0, dtype=stage_dtype), np.empty(0, dtype=run_dtype)
+
+    try:
+        if fp.endswith(".out"):
+            return empty[0], parse_runs(fp, instance, condition, rep, "out")
+        if fp.endswith(".bench"):
+            return empty[0], parse_runs(fp, instance, condition, rep, "bench")
+        if op.basename(fp) == "makespan.csv":
+            return empty[0], parse_runs(fp, instance, condition, rep, "makespan")
+
+        with open(fp) as f:
+            header = f.readline()
+        if header.startswith("action,file,timestamp,pid,runtime"):
+            return parse_benchmark(fp, instance, condition, rep), empty[1]
+    except (ValueError, IndexError) as e:
+        print(f"skipping {fp}: {e}")
+
+    return empty
+
+
+def scan(root, workers=None):
+    files = [
+        op.join(d, f)
+        for d, _, fns in walk(root)
+        for f in sorted(fns)
+        if f.endswith((".csv", ".out", ".bench"))
+    ]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parsed = list(executor.map(parse_file, [(root, fp) for fp in files], chunksize=16))
+
+    stages = np.concatenate([p[0] for p in parsed] or [np.empty(0, dtype=stage_dtype)])
+    runs = np.concatenate([p[1] for p in parsed] or [np.empty(0, dtype=run_dtype)])
+    return stages, runs
+
+
+def write_dataset(out_dir, table, arr, fmt="npz"):
+    # one file per instance and condition
+    keys = np.unique(arr[["instance", "condition"]]) if len(arr) > 0 else []
+
+    for instance, condition in keys:
+        part = arr[(arr["instance"] == instance) & (arr["condition"] == condition)]
+        part_dir = op.join(
+            out_dir, table, f"instance={instance}", f"condition={condition.replace('/', '-')}"
+        )
+        makedirs(part_dir, exist_ok=True)
+
+        if fmt == "parquet":
+            columns = {name: part[name] for name in part.dtype.names}
+            pq.write_table(pa.table(columns), op.join(part_dir, "part-0.parquet"))
+        else:
+            np.savez_compressed(op.join(part_dir, "part-0.npz"), data=part)
+
+
+def load_dataset(out_dir, table):
+    dtype = stage_dtype if table == "stages" else run_dtype
+    parts = []
+
+    for d, _, fns in walk(op.join(out_dir, table)):
+        for fn in sorted(fns):
+            if fn.endswith(".npz"):
+                with np.load(op.join(d, fn)) as f:
+                    parts.append(f["data"])
+            elif fn.endswith(".parquet"):
+                t = pq.read_table(op.join(d, fn))
+                part = np.empty(t.num_rows, dtype=dtype)
+                for name in part.dtype.names:
+                    part[name] = t.column(name).to_numpy()
+                parts.append(part)
+
+    return np.concatenate(parts or [np.empty(0, dtype=dtype)]).astype(dtype)
+
+
+def summarise(arr, by=group_default, value="duration", z=1.96):
+    if len(arr) == 0:
+        return {}
+
+    # groups are contiguous once sorted, values ascending within each group
+    _, codes = np.unique(arr[list(by)], return_inverse=True)
+    order = np.lexsort((arr[value], codes))
+    values = arr[value][order].astype(np.float64)
+    codes = codes.reshape(-1)[order]
+
+    first = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+    n = np.diff(np.r_[first, len(values)])
+
+    mean = np.add.reduceat(values, first) / n
+    var = np.add.reduceat((values - np.repeat(mean, n)) ** 2, first) / np.maximum(n - 1, 1)
+    std = np.sqrt(var)
+
+    def _quantile(q):
+        pos = first + q * (n - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+    # distribution-free interval of the median from the binomial order statistics
+    half = z * np.sqrt(n) / 2
+    ci_lo = first + np.clip(np.floor(n / 2 - half).astype(np.int64), 0, n - 1)
+    ci_hi = first + np.clip(np.ceil(n / 2 + half).astype(np.int64), 0, n - 1)
+
+    summary = {name: arr[name][order][first] for name in by}
+    summary.update(
+        {
+            "n": n,
+            "mean": mean,
+            "std": std,
+            "mean_ci_low": mean - z * std / np.sqrt(n),
+            "mean_ci_high": mean + z * std / np.sqrt(n),
+            "median_ci_low": values[ci_lo],
+            "median_ci_high": values[ci_hi],
+        }
+    )
+    for q in percentiles:
+        summary[f"p{q}"] = _quantile(q / 100)
+
+    return summary
+
+
+def write_summary(fp, summary):
+    names = list(summary)
+    with open(fp, "w") as f:
+        f.write(",".join(names) + "\n")
+        for row in zip(*(summary[name] for name in names)):
+            f.write(",".join(str(v) for v in row) + "\n")
+
+
+@click.command()
+@click.argument("results_fldr", type=str)
+@click.argument("out_dir", type=str)
+@click.option("--workers", type=int, default=None, help="number of parsing processes")
+@click.option(
+    "--format",
+    "fmt",
+    type=click.Choice(["npz", "parquet"]),
+    default="npz",
+    help="format of the dataset partitions, parquet requires pyarrow",
+)
+@click.option(
+    "--group_by",
+    type=str,
+    default=",".join(group_default),
+    help="comma separated columns the stage summary is grouped by",
+)
+@click.option(
+    "--reuse", is_flag=True, help="summarise the dataset in OUT_DIR instead of rescanning"
+)
+def main(results_fldr, out_dir, workers, fmt, group_by, reuse):
+    if fmt == "parquet" and pa is None:
+        raise click.UsageError("parquet output requires pyarrow")
+
+    if reuse is True:
+        stages, runs = load_dataset(out_dir, "stages"), load_dataset(out_dir, "runs")
+    else:
+        stages, runs = scan(results_fldr, workers)
+        write_dataset(out_dir, "stages", stages, fmt)
+        write_dataset(out_dir, "runs", runs, fmt)
+
+    print(f"{len(stages)} stage durations, {len(runs)} runs")
+
+    makedirs(out_dir, exist_ok=True)
+    write_summary(op.join(out_dir, "stages-summary.csv"), summarise(stages, group_by.split(",")))
+    write_summary(
+        op.join(out_dir, "runs-summary.csv"),
+        summarise(runs, ("instance", "condition", "bench")),
+    )
+
+
+if __name__ == "__main__":
+    main()
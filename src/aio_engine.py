@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from os import cpu_count
+from src import clients, compressors, helpers, nifti
+from src.helpers import abenchmark, record_bytes
+
+
+def run_cpu(executor, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(executor, partial(func, *args, **kwargs))
+
+
+def decode(c_data, fp, zero_copy=False):
+    data = compressors.codec_for(fp).decompress(c_data)
+    if zero_copy is True:
+        return nifti.image_from_buffer(data), len(data)
+    return nifti.from_buffer(data), len(data)
+
+
+def encode(im, fp, clevel=9, threads=1):
+    raw = nifti.to_buffer(im)
+    codec = compressors.codec_for(fp)
+    return codec.compress(raw, clevel=clevel, threads=threads), len(raw)
+
+
+@abenchmark
+async def reads3(fs, fp, **kwargs):
+    data = await fs._cat_file(fp)
+    record_bytes(len(data), len(data))
+    return data
+
+
+@abenchmark
+async def writes3(fs, out_fp, data, **kwargs):
+    await fs._pipe_file(out_fp, data)
+    record_bytes(len(data), len(data))
+
+
+@abenchmark
+async def read(fs, fp, executor, zero_copy=False, **kwargs):
+    c_data = await reads3(fs, fp=fp, bfile=kwargs.get("bfile"))
+    im, size = await run_cpu(executor, decode, c_data, fp, zero_copy=zero_copy)
+    record_bytes(len(c_data), size)
+    return im
+
+
+@abenchmark
+async def increment(im, fp, executor, inplace=False, **kwargs):
+    return await run_cpu(executor, nifti.increment, im, inplace=inplace)
+
+
+@abenchmark
+async def write(fs, im, fp, bucket, i, executor, clevel=9, threads=1, **kwargs):
+    out_fp = helpers.out_path(fp, bucket, i)
+    data, size = await run_cpu(executor, encode, im, fp, clevel=clevel, threads=threads)
+    await writes3(fs, out_fp=out_fp, data=data, fp=fp, bfile=kwargs.get("bfile"))
+    record_bytes(size, len(data))
+    return out_fp
+
+
+async def process(fp, in_fs, out_fs, it, bucket, executor, options, bfile=None):
+    for i in range(it):
+        # only the original inputs are read with the (possibly anonymous) input client
+        fs = in_fs if i == 0 else out_fs
+
+        im = await read(
+            fs, fp=fp, executor=executor, zero_copy=options["zero_copy"], bfile=bfile
+        )
+        inc = await increment(
+            im=im, fp=fp, executor=executor, inplace=options["inplace"], bfile=bfile
+        )
+        fp = await write(
+            out_fs,
+            im=inc,
+            fp=fp,
+            bucket=bucket,
+            i=i,
+            executor=executor,
+            clevel=options["clevel"],
+            threads=options["threads"],
+            bfile=bfile,
+        )
+
+    return fp
+
+
+async def consumer(queue, outfiles, *args, **kwargs):
+    # each consumer processes one file at a time, so at most max_inflight
+    # files are downloading, uploading or waiting for the cpu executor
+    while not queue.empty():
+        idx, fp = queue.get_nowait()
+        outfiles[idx] = await process(fp, *args, **kwargs)
+
+
+async def pipeline(files, it, bucket, anon, max_inflight, cpu_workers, options, bfile=None):
+    in_fs, in_session = await clients.open_async_fs(anon=anon)
+    out_fs, out_session = await clients.open_async_fs()
+
+    queue = asyncio.Queue()
+    for idx, fp in enumerate(files):
+        queue.put_nowait((idx, fp))
+
+    outfiles = [None] * len(files)
+
+    with ThreadPoolExecutor(max_workers=cpu_workers) as executor:
+        try:
+            await asyncio.gather(
+                *[
+                    consumer(
+                        queue, outfiles, in_fs, out_fs, it, bucket, executor, options, bfile=bfile
+                    )
+                    for _ in range(max_inflight)
+                ]
+            )
+        finally:
+            await in_session.close()
+            await out_session.close()
+
+    return outfiles
+
+
+def run(files, it, bucket, anon=False, max_inflight=4, cpu_workers=None, bfile=None, **options):
+    if any("file://" in fp for fp in files + [bucket]):
+        raise ValueError("the asyncio engine only supports s3 inputs and outputs")
+
+    if cpu_workers is None:
+        cpu_workers = cpu_count()
+
+    options = {"zero_copy": False, "inplace": False, "clevel": 9, "threads": 1, **options}
+
+    return asyncio.run(
+        pipeline(files, it, bucket, anon, max_inflight, cpu_workers, options, bfile=bfile)
+    )
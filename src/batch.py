@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from src import clients, compressors, helpers, nifti
+from src.helpers import benchmark, record_bytes
+
+
+def layout(header):
+    # volumes with the same layout stack into one array; scaled data cannot be
+    # incremented on its stored values
+    slope, inter = header.get_slope_inter()
+    if slope is not None and (slope != 1 or inter != 0):
+        return None
+    return (header.get_data_shape(), header.get_data_dtype().str, int(header["vox_offset"]))
+
+
+def _download(fs, fp):
+    c_data = fs.cat_file(fp)
+    return c_data, compressors.codec_for(fp).decompress(c_data)
+
+
+@benchmark
+def read_batch(files, anon=False, workers=10, **kwargs):
+    fs = clients.get_fs(anon=anon)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        downloaded = list(executor.map(lambda fp: _download(fs, fp), files))
+
+    record_bytes(
+        sum(len(c_data) for c_data, _ in downloaded), sum(len(raw) for _, raw in downloaded)
+    )
+    return [raw for _, raw in downloaded]
+
+
+@benchmark
+def increment_batch(buffers, **kwargs):
+    # one output buffer per input, the header bytes are kept as is
+    outputs = [None] * len(buffers)
+    groups = {}
+    for i, buf in enumerate(buffers):
+        header = nifti.parse_header(buf)
+        groups.setdefault(layout(header), []).append(i)
+
+    for key, members in groups.items():
+        if key is None:
+            for i in members:
+                outputs[i] = nifti.to_buffer(nifti.increment(nifti.from_buffer(buffers[i])))
+            continue
+
+        shape, dtype, offset = key
+        n_vox = int(np.prod(shape))
+        itemsize = np.dtype(dtype).itemsize
+
+        # contiguous (volumes, voxels) array in file order, updated in one pass
+        stacked = np.empty((len(members), n_vox), dtype=dtype)
+        for row, i in enumerate(members):
+            stacked[row] = np.frombuffer(buffers[i], dtype=dtype, count=n_vox, offset=offset)
+        nifti.saturating_add(stacked, out=stacked)
+
+        for row, i in enumerate(members):
+            out = bytearray(buffers[i][: offset + n_vox * itemsize])
+            out[offset:] = stacked[row].data
+            outputs[i] = out
+
+    record_bytes(sum(len(b) for b in buffers), sum(len(b) for b in outputs))
+    return outputs
+
+
+def _upload(fs, out_fp, raw, clevel, threads):
+    data = compressors.codec_for(out_fp).compress(raw, clevel=clevel, threads=threads)
+    fs.pipe_file(out_fp, data)
+    return len(data)
+
+
+@benchmark
+def write_batch(files, buffers, bucket, i, clevel=9, threads=1, workers=10, **kwargs):
+    fs = clients.get_fs()
+    out_files = [helpers.out_path(fp, bucket, i) for fp in files]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        sizes = list(
+            executor.map(
+                lambda args: _upload(fs, *args, clevel, threads), zip(out_files, buffers)
+            )
+        )
+
+    record_bytes(sum(len(b) for b in buffers), sum(sizes))
+    return out_files
+
+
+def run(files, it, bucket, anon=False, batch_size=64, clevel=9, threads=1, bfile=None):
+    workers = clients.config["max_pool"]
+    outfiles = []
+
+    for first in range(0, len(files), batch_size):
+        batch = files[first : first + batch_size]
+
+        for i in range(it):
+            # only the inputs may be public, later iterations read our outputs
+            buffers = read_batch(
+                batch, anon=anon and i == 0, workers=workers, fp=batch[0], bfile=bfile
+            )
+            buffers = increment_batch(buffers, fp=batch[0], bfile=bfile)
+            batch = write_batch(
+                batch,
+                buffers,
+                bucket,
+                i,
+                clevel=clevel,
+                threads=threads,
+                workers=workers,
+                fp=batch[0],
+                bfile=bfile,
+            )
+
+        outfiles.extend(batch)
+
+    return outfiles
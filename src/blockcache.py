@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+import fcntl
+import hashlib
+import os
+import shutil
+from src.transfer import fetch_range
+from contextlib import contextmanager
+from os import path as op
+from threading import Lock
+
+# number of lock files blocks are hashed onto
+lock_stripes = 64
+block_suffix = ".blk"
+
+
+def parse_tiers(spec):
+    # "/dev/shm/s3cache:2048,/tmp/s3cache:10240" -> [(dir, limit in bytes), ...]
+    tiers = []
+    for tier in spec.split(","):
+        tier_dir, limit = tier.rsplit(":", 1)
+        tiers.append((tier_dir, int(float(limit) * 1024 ** 2)))
+    return tiers
+
+
+def object_version(info):
+    # s3 ETags change whenever the object is overwritten
+    etag = info.get("ETag") or info.get("etag")
+    if etag is not None:
+        return etag.strip('"')
+    return f"{info['name']}-{info['size']}-{info.get('LastModified', info.get('created'))}"
+
+
+@contextmanager
+def flock(fp):
+    with open(fp, "a+") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+class BlockCache:
+    # Byte ranges of s3 objects cached as files keyed by ETag and range, in
+    # tiers ordered fastest first. A full tier demotes its least recently used
+    # blocks to the next one, the last tier deletes them. File locks make
+    # concurrent processes wait for a block being downloaded instead of
+    # fetching it again.
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.lock = Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+        for tier_dir, _ in tiers:
+            os.makedirs(tier_dir, exist_ok=True)
+        self.lock_dir = op.join(tiers[0][0], ".locks")
+        os.makedirs(self.lock_dir, exist_ok=True)
+
+    def _count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def block_name(self, version, start, end):
+        key = f"{version}:{start}-{end}".encode("utf-8")
+        return hashlib.sha1(key).hexdigest() + block_suffix
+
+    def _lock_path(self, name):
+        return op.join(self.lock_dir, f"{int(name[:8], 16) % lock_stripes}.lock")
+
+    def get(self, name):
+        for tier_dir, _ in self.tiers:
+            fp = op.join(tier_dir, name)
+            try:
+                with open(fp, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+
+            # mtime orders blocks for eviction, as atime is often disabled
+            try:
+                os.utime(fp)
+            except FileNotFoundError:
+                pass
+            return data
+
+        return None
+
+    def put(self, name, data):
+        for tier, (tier_dir, limit) in enumerate(self.tiers):
+            if len(data) > limit:
+                continue
+
+            with flock(op.join(tier_dir, ".lock")):
+                self._evict(tier, len(data))
+
+                # readers never see a partially written block
+                tmp_fp = op.join(tier_dir, f".{name}.{os.getpid()}")
+                with open(tmp_fp, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_fp, op.join(tier_dir, name))
+            return True
+
+        return False
+
+    def _evict(self, tier, needed):
+        tier_dir, limit = self.tiers[tier]
+
+        blocks = []
+        for entry in os.scandir(tier_dir):
+            if entry.name.endswith(block_suffix) and not entry.name.startswith("."):
+                st = entry.stat()
+                blocks.append((st.st_mtime, st.st_size, entry.path))
+
+        used = sum(size for _, size, _ in blocks)
+        for _, size, fp in sorted(blocks):
+            if used + needed <= limit:
+                break
+
+            if tier + 1 < len(self.tiers) and size <= self.tiers[tier + 1][1]:
+                next_dir = self.tiers[tier + 1][0]
+                name = op.basename(fp)
+
+                with flock(op.join(next_dir, ".lock")):
+                    self._evict(tier + 1, size)
+                    tmp_fp = op.join(next_dir, f".{name}.{os.getpid()}")
+                    shutil.move(fp, tmp_fp)
+                    os.replace(tmp_fp, op.join(next_dir, name))
+            else:
+                os.remove(fp)
+                self._count("evictions")
+            used -= size
+
+    def fetch_range(self, fs, fp, start, end, version=None, fetch=fetch_range):
+        if version is None:
+            version = object_version(fs.info(fp))
+        name = self.block_name(version, start, end)
+
+        data = self.get(name)
+        if data is not None:
+            self._count("hits")
+            return data
+
+        with flock(self._lock_path(name)):
+            # another process may have fetched it while we waited
+            data = self.get(name)
+            if data is not None:
+                self._count("hits")
+                return data
+
+            data = fetch(fs, fp, start, end)
+            self._count("misses")
+            self.put(name, data)
+
+        return data
+
+    def clear(self):
+        for tier_dir, _ in self.tiers:
+            for entry in os.scandir(tier_dir):
+                if entry.name.endswith(block_suffix):
+                    os.remove(entry.path)
+
+    def write_stats(self, out_dir, bench_name):
+        with open(op.join(out_dir, "blockcache.csv"), "a+") as f:
+            f.write(
+                f"{bench_name},{self.stats['hits']},{self.stats['misses']},"
+                f"{self.stats['evictions']}\n"
+            )
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import bz2
+import lzma
+import zlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from os import cpu_count, path as op
+from threading import Condition
+from src import compressors, nifti
+from src.transfer import fetch_range
+
+# compressed bytes fetched to decode the header of a compressed image
+header_range = 64 * 1024
+
+# live uncompressed copies of an image in a read/increment/write chain: the
+# decompressed download, the incremented array and the serialised output
+raw_copies = 3
+
+# uncompressed/compressed size ratio assumed when the header cannot be decoded
+fallback_ratio = 4
+
+decompressors = {
+    "none": None,
+    "gzip": lambda: zlib.decompressobj(wbits=31),
+    "bz2": bz2.BZ2Decompressor,
+    "xz": lzma.LZMADecompressor,
+}
+
+
+def raw_size(fs, fp, size):
+    # uncompressed image size from the dims and datatype of its header
+    codec = compressors.codec_for(fp).name
+    if codec not in decompressors:
+        return None
+
+    # an uncompressed image is read as is, the listed size is its raw size
+    if codec == "none":
+        return size
+
+    try:
+        chunk = fetch_range(fs, fp, 0, min(size, header_range))
+        hdr = decompressors[codec]().decompress(chunk, nifti.header_size)
+        header = nifti.parse_header(hdr)
+    except (ValueError, OSError, EOFError, zlib.error):
+        return None
+
+    n_vox = int(np.prod(header.get_data_shape()))
+    return int(header["vox_offset"]) + n_vox * header.get_data_dtype().itemsize
+
+
+def footprint(fs, fp, size=None):
+    if "file://" in fp:
+        size = op.getsize(fp.removeprefix("file:/"))
+    elif size is None:
+        size = fs.info(fp)["size"]
+
+    raw = raw_size(fs, fp, size) if size > 0 else 0
+    if raw is None:
+        raw = size * fallback_ratio
+
+    # downloaded and uploaded objects, plus the uncompressed copies
+    return 2 * size + raw_copies * raw
+
+
+def footprints(fs, files, sizes=None, workers=4):
+    # estimated concurrently, ideally from the listed sizes, and handed out
+    # in order while the first admitted tasks already run
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        return executor.map(footprint, repeat(fs), files, sizes or repeat(None))
+    finally:
+        executor.shutdown(wait=False)
+
+
+class MemoryBudget:
+    # Admits tasks while the sum of their estimated footprints fits in the
+    # budget. A task larger than the budget runs once nothing else does.
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.peak = 0
+        self.cond = Condition()
+
+    def acquire(self, need):
+        with self.cond:
+            while self.used > 0 and self.used + need > self.limit:
+                self.cond.wait()
+            self.used += need
+            self.peak = max(self.peak, self.used)
+
+    def release(self, need):
+        with self.cond:
+            self.used -= need
+            self.cond.notify_all()
+
+    def compute(self, tasks, footprints, workers=None):
+        # tasks (dask.delayed) start in order as soon as there is headroom,
+        # each one computed by the worker that admitted it
+        futures = []
+        with ThreadPoolExecutor(max_workers=workers or cpu_count()) as executor:
+            for task, need in zip(tasks, footprints):
+                self.acquire(need)
+                future = executor.submit(task.compute, scheduler="sync")
+                future.add_done_callback(lambda f, need=need: self.release(need))
+                futures.append(future)
+
+            return [f.result() for f in futures]
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+import dask
+import dask.array as da
+import numpy as np
+from os import cpu_count
+from src import nifti
+from src.transfer import fetch_range, part_size_default, MultipartWriter
+
+
+def read_header(fs, fp):
+    header = nifti.parse_header(fetch_range(fs, fp, 0, nifti.header_size + 4))
+    offset = int(header["vox_offset"])
+
+    # everything up to the data (header, extensions, padding) is copied to the output as is
+    prefix = fetch_range(fs, fp, 0, offset)
+
+    slope, inter = header.get_slope_inter()
+    if slope is not None and (slope != 1 or inter != 0):
+        raise ValueError(f"{fp}: chunked mode does not support scaled data")
+
+    return header, prefix
+
+
+def slab_size(header):
+    # bytes covered by one index along the slowest (last) axis
+    shape = header.get_data_shape()
+    return int(np.prod(shape[:-1])) * header.get_data_dtype().itemsize
+
+
+def chunk_bounds(header, chunk_size):
+    n = header.get_data_shape()[-1]
+    step = max(1, chunk_size // slab_size(header))
+    return [(k, min(k + step, n)) for k in range(0, n, step)]
+
+
+def read_chunk(fs, fp, header, k0, k1):
+    slab = slab_size(header)
+    start = int(header["vox_offset"]) + k0 * slab
+
+    buf = bytearray(fetch_range(fs, fp, start, start + (k1 - k0) * slab))
+    shape = header.get_data_shape()[:-1] + (k1 - k0,)
+
+    return np.frombuffer(buf, dtype=header.get_data_dtype()).reshape(shape, order="F")
+
+
+def from_s3(fs, fp, header, chunk_size=part_size_default):
+    shape = header.get_data_shape()
+    dtype = header.get_data_dtype()
+
+    chunks = [
+        da.from_delayed(
+            dask.delayed(read_chunk)(fs, fp, header, k0, k1),
+            shape=shape[:-1] + (k1 - k0,),
+            dtype=dtype,
+        )
+        for k0, k1 in chunk_bounds(header, chunk_size)
+    ]
+    return da.concatenate(chunks, axis=-1)
+
+
+def to_s3(
+    fs,
+    out_fp,
+    arr,
+    prefix,
+    parallel_parts=1,
+    part_size=part_size_default,
+    window=None,
+    dtype=None,
+):
+    if window is None:
+        window = max(parallel_parts, cpu_count())
+
+    # dask normalises the byte order of concatenated arrays, the data is
+    # written in the one of the header written before it
+    if dtype is None:
+        dtype = arr.dtype
+
+    # only the last axis is chunked, chunks are contiguous in the output file
+    blocks = [arr.blocks[(0,) * (arr.ndim - 1) + (j,)] for j in range(arr.numblocks[-1])]
+
+    with MultipartWriter(fs, out_fp, parallel_parts, part_size) as f:
+        f.write(prefix)
+
+        # compute a window of chunks at a time so memory use stays bounded
+        for w in range(0, len(blocks), window):
+            for block in dask.compute(*blocks[w : w + window]):
+                f.write(np.asarray(block, dtype=dtype).tobytes(order="F"))
+
+    return out_fp
+
+
+def increment_block(block):
+    # the result keeps the dtype, and byte order, of the file
+    return nifti.saturating_add(block, out=np.empty_like(block))
+
+
+def increment(fs, fp, out_fp, parallel_parts=1, part_size=part_size_default):
+    header, prefix = read_header(fs, fp)
+    arr = from_s3(fs, fp, header, chunk_size=part_size)
+
+    dtype = header.get_data_dtype()
+    inc = arr.map_blocks(increment_block, dtype=dtype)
+    return to_s3(fs, out_fp, inc, prefix, parallel_parts, part_size, dtype=dtype)
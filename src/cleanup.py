@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import shlex
+import shutil
+import subprocess as sp
+from concurrent.futures import ThreadPoolExecutor
+from src import clients, helpers
+from src.helpers import benchmark
+from threading import Lock
+
+# largest number of keys a single DeleteObjects request accepts
+delete_batch = 1000
+
+
+def delete_keys(fs, bucket, keys):
+    # one request per 1000 keys instead of one per object
+    errors = []
+    for first in range(0, len(keys), delete_batch):
+        objects = [{"Key": key} for key in keys[first : first + delete_batch]]
+        response = fs.call_s3(
+            "delete_objects", Bucket=bucket, Delete={"Objects": objects, "Quiet": True}
+        )
+        errors.extend(response.get("Errors", []))
+
+    if len(errors) > 0:
+        raise OSError(f"{len(errors)} objects of {bucket} were not deleted, e.g. {errors[0]}")
+    return len(keys)
+
+
+def clear_prefix(fs, prefix, workers=4):
+    bucket, _, key_prefix = prefix.removeprefix("s3://").partition("/")
+    # outputs/bench_a must not match outputs/bench_ab
+    if key_prefix != "" and not key_prefix.endswith("/"):
+        key_prefix += "/"
+
+    kwargs = {"Bucket": bucket, "Prefix": key_prefix, "MaxKeys": delete_batch}
+    futures = []
+
+    # every page of keys is deleted while the next one is listed
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            response = fs.call_s3("list_objects_v2", **kwargs)
+            keys = [obj["Key"] for obj in response.get("Contents", [])]
+            if len(keys) > 0:
+                futures.append(executor.submit(delete_keys, fs, bucket, keys))
+
+            if not response.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+        deleted = sum(f.result() for f in futures)
+
+    fs.invalidate_cache(prefix)
+    return deleted
+
+
+@benchmark
+def cleanup(prefix, workers=4, host=None, **kwargs):
+    if "file://" in prefix and host is not None:
+        # local outputs of an experiment run on another host
+        path = shlex.quote(prefix.removeprefix("file:/"))
+        sp.run(["ssh", host, f"rm -rf {path}"], check=True)
+    elif "file://" in prefix:
+        shutil.rmtree(prefix.removeprefix("file:/"), ignore_errors=True)
+    else:
+        clear_prefix(clients.get_fs(), prefix, workers)
+
+
+class Cleaner:
+    # Deletes the outputs of finished experiments, several prefixes at a
+    # time. In the background, cleanup overlaps with the following
+    # experiments, which only wait for the cleanup of their own prefix.
+    # Durations are appended as cleanup rows to the experiment's benchmark.
+    def __init__(self, workers=4, background=False):
+        self.workers = workers
+        self.background = background
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = {}
+        self.lock = Lock()
+        self.merge_lock = Lock()
+
+    def _run(self, prefix, bfile, host=None):
+        try:
+            cleanup(prefix, workers=self.workers, host=host, fp=prefix, bfile=bfile)
+        finally:
+            # one merge at a time, rows of other benchmarks share the buffer
+            with self.merge_lock:
+                helpers.merge_bench(bfile)
+
+    def clear(self, outputs, host=None):
+        # outputs: [(prefix, benchmark file), ...], local ones on host if set
+        with self.lock:
+            for prefix, bfile in outputs:
+                self.pending[prefix] = self.executor.submit(self._run, prefix, bfile, host)
+
+        if self.background is False:
+            for prefix, _ in outputs:
+                self.wait(prefix)
+
+    def wait(self, prefix):
+        with self.lock:
+            future = self.pending.pop(prefix, None)
+        if future is not None:
+            future.result()
+
+    def shutdown(self):
+        for prefix in list(self.pending):
+            self.wait(prefix)
+        self.executor.shutdown(wait=True)
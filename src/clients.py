@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+import s3fs
+from os import environ, path as op
+from threading import Lock
+
+# process-wide S3 clients shared by every I/O function (and dask threads)
+clients = {}
+lock = Lock()
+defaults = {"max_pool": 10, "endpoint_url": environ.get("AWS_ENDPOINT_URL")}
+config = dict(defaults)
+stats = {"opened": 0, "reused": 0}
+
+
+def configure(max_pool=None, endpoint_url=None):
+    if max_pool is not None:
+        config["max_pool"] = max_pool
+    if endpoint_url is not None:
+        config["endpoint_url"] = endpoint_url
+
+
+def fs_kwargs():
+    kwargs = {"config_kwargs": {"max_pool_connections": config["max_pool"]}}
+
+    # e.g. a local S3 stand-in, addressed with path-style urls
+    if config["endpoint_url"] is not None:
+        kwargs["client_kwargs"] = {"endpoint_url": config["endpoint_url"]}
+        kwargs["config_kwargs"]["s3"] = {"addressing_style": "path"}
+
+    return kwargs
+
+
+def get_fs(anon=False):
+    key = (anon, config["max_pool"], config["endpoint_url"])
+
+    with lock:
+        if key in clients:
+            stats["reused"] += 1
+            return clients[key]
+
+        # bypass fsspec's instance cache so the pool size is always honoured
+        fs = s3fs.S3FileSystem(anon=anon, skip_instance_cache=True, **fs_kwargs())
+        clients[key] = fs
+        stats["opened"] += 1
+
+    return fs
+
+
+async def open_async_fs(anon=False):
+    # async clients are bound to the running event loop, so they are not pooled
+    fs = s3fs.S3FileSystem(
+        anon=anon, asynchronous=True, skip_instance_cache=True, **fs_kwargs()
+    )
+    session = await fs.set_session()
+
+    with lock:
+        stats["opened"] += 1
+
+    return fs, session
+
+
+def reset():
+    with lock:
+        clients.clear()
+        config.update(defaults)
+        stats["opened"] = 0
+        stats["reused"] = 0
+
+
+def write_stats(out_dir, bench_name):
+    with open(op.join(out_dir, "clients.csv"), "a+") as f:
+        f.write(f"{bench_name},{config['max_pool']},{stats['opened']},{stats['reused']}\n")
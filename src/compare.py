@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+import sys
+import click
+import numpy as np
+from math import comb, erfc, sqrt
+from src import aggregate
+
+# exact p-values up to this many observations in total, normal approximation above
+exact_limit = 40
+columns = [
+    "n_baseline",
+    "n_candidate",
+    "median_baseline",
+    "median_candidate",
+    "change",
+    "u",
+    "p",
+    "regression",
+]
+
+
+def rank(values):
+    # ranks starting at 1, ties get the mean of their ranks
+    order = np.argsort(values, kind="stable")
+    ranks = np.empty(len(values), dtype=np.float64)
+    ranks[order] = np.arange(1, len(values) + 1)
+
+    _, inverse, counts = np.unique(values, return_inverse=True, return_counts=True)
+    sums = np.bincount(inverse, weights=ranks)
+    return (sums / counts)[inverse], counts
+
+
+def u_distribution(m, n):
+    # number of orderings of m and n observations giving each value of U
+    freq = np.zeros((n + 1, m * n + 1), dtype=np.float64)
+    freq[:, 0] = 1
+    for i in range(1, m + 1):
+        prev = freq.copy()
+        for j in range(1, n + 1):
+            # the largest observation is one of the i, adding j to U, or one of the j
+            freq[j] = freq[j - 1]
+            freq[j, j:] += prev[j, : m * n + 1 - j]
+    return freq[n]
+
+
+def mann_whitney(candidate, baseline):
+    # one-sided test that the candidate durations tend to be larger
+    m, n = len(candidate), len(baseline)
+    ranks, ties = rank(np.concatenate([candidate, baseline]))
+    u = ranks[:m].sum() - m * (m + 1) / 2
+
+    if m + n <= exact_limit and np.all(ties == 1):
+        freq = u_distribution(m, n)
+        return u, freq[int(u) :].sum() / comb(m + n, m)
+
+    tie_term = (ties ** 3 - ties).sum() / ((m + n) * (m + n - 1))
+    sigma = sqrt(m * n / 12 * ((m + n + 1) - tie_term))
+    if sigma == 0:
+        return u, 1.0
+
+    # continuity corrected normal approximation
+    z = (u - m * n / 2 - 0.5) / sigma
+    return u, 0.5 * erfc(z / sqrt(2))
+
+
+def samples(stages, runs, by):
+    # total time of each stage per repetition, makespans as their own stage
+    makespans = np.zeros(len(runs), dtype=aggregate.stage_dtype)
+    for name in ("instance", "condition", "rep", "bench", "duration"):
+        makespans[name] = runs[name]
+    makespans["stage"] = "makespan"
+
+    arr = np.concatenate([stages, makespans])
+    keys = list(by) + ["rep"]
+    uniq, inverse = np.unique(arr[keys], return_inverse=True)
+    totals = np.bincount(inverse.reshape(-1), weights=arr["duration"])
+
+    groups = {}
+    for key, total in zip(uniq, totals):
+        groups.setdefault(tuple(key)[:-1], []).append(total)
+    return {k: np.array(v) for k, v in groups.items()}
+
+
+def smallest_p(m, n):
+    # one-sided exact p-value when all m candidate runs are slower than all n
+    return 1 / comb(m + n, m)
+
+
+def compare(baseline, candidate, threshold=0.05, alpha=0.05, min_reps=4):
+    rows = []
+
+    for key in sorted(set(baseline) & set(candidate)):
+        b, c = baseline[key], candidate[key]
+        if len(b) < min_reps or len(c) < min_reps:
+            continue
+
+        change = np.median(c) / np.median(b) - 1 if np.median(b) > 0 else 0.0
+        u, p = mann_whitney(c, b)
+        regression = bool(p < alpha and change > threshold)
+        rows.append((key, len(b), len(c), np.median(b), np.median(c), change, u, p, regression))
+
+    return rows
+
+
+@click.command()
+@click.argument("baseline_fldr", type=str)
+@click.argument("candidate_fldr", type=str)
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.05,
+    help="smallest relative slowdown of the median reported as a regression",
+)
+@click.option("--alpha", type=float, default=0.05, help="significance level")
+@click.option(
+    "--min_reps",
+    type=int,
+    default=4,
+    help="skip stages with fewer repetitions than this. With n runs on each side the "
+    "smallest p-value is 1/C(2n, n), so at least 4 are needed at alpha 0.05",
+)
+@click.option(
+    "--group_by",
+    type=str,
+    default=",".join(aggregate.group_default),
+    help="comma separated columns identifying a stage in both result sets",
+)
+@click.option("--out", type=str, default=None, help="write the comparison to this csv")
+@click.option("--workers", type=int, default=None, help="number of parsing processes")
+def main(baseline_fldr, candidate_fldr, threshold, alpha, min_reps, group_by, out, workers):
+    if smallest_p(min_reps, min_reps) >= alpha:
+        raise click.UsageError(
+            f"{min_reps} repetitions can never reach p < {alpha}, raise --min_reps"
+        )
+
+    by = group_by.split(",")
+    baseline = samples(*aggregate.scan(baseline_fldr, workers), by)
+    candidate = samples(*aggregate.scan(candidate_fldr, workers), by)
+
+    rows = compare(baseline, candidate, threshold, alpha, min_reps)
+
+    if out is not None:
+        with open(out, "w") as f:
+            f.write(",".join(by) + "," + ",".join(columns) + "\n")
+            for key, *values in rows:
+                f.write(",".join(str(v) for v in (*key, *values)) + "\n")
+
+    regressions = [r for r in rows if r[-1] is True]
+    for key, _, _, med_b, med_c, change, _, p, _ in regressions:
+        print(
+            f"REGRESSION {'/'.join(key)}: {med_b:.3f}s -> {med_c:.3f}s "
+            f"({change:+.1%}, p={p:.4f})"
+        )
+    print(f"{len(rows)} stages compared, {len(regressions)} regressions")
+
+    # e.g. different layouts or too few repetitions, nothing was checked
+    if len(rows) == 0:
+        print("no stage with enough repetitions in both result sets")
+        sys.exit(2)
+    if len(regressions) > 0:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
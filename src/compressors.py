@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+import bz2
+import gzip
+import lzma
+from collections import namedtuple
+from src import parallel_gzip
+
+# optional codecs, only registered when installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+
+Codec = namedtuple("Codec", ["name", "suffix", "levels", "compress", "decompress"])
+
+codecs = {}
+
+
+def register(codec):
+    codecs[codec.name] = codec
+
+
+def codec_for(fp):
+    # longest matching suffix wins, uncompressed otherwise
+    matches = [c for c in codecs.values() if c.suffix != "" and fp.endswith(c.suffix)]
+    if len(matches) == 0:
+        return codecs["none"]
+    return max(matches, key=lambda c: len(c.suffix))
+
+
+def _none_compress(data, clevel=0, threads=1):
+    return data
+
+
+def _none_decompress(data):
+    return data
+
+
+def _gzip_compress(data, clevel=9, threads=1):
+    return parallel_gzip.compress(data, clevel=clevel, threads=threads)
+
+
+def _bz2_compress(data, clevel=9, threads=1):
+    return bz2.compress(data, compresslevel=max(clevel, 1))
+
+
+def _xz_compress(data, clevel=6, threads=1):
+    return lzma.compress(data, preset=clevel)
+
+
+def _zstd_compress(data, clevel=3, threads=1):
+    # zstandard disables multi-threaded compression with threads=0
+    cctx = zstandard.ZstdCompressor(level=clevel, threads=threads if threads > 1 else 0)
+    return cctx.compress(data)
+
+
+def _zstd_decompress(data):
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+def _lz4_compress(data, clevel=0, threads=1):
+    return lz4frame.compress(data, compression_level=clevel)
+
+
+register(Codec("none", "", range(1), _none_compress, _none_decompress))
+register(Codec("gzip", ".gz", range(10), _gzip_compress, gzip.decompress))
+
+# stdlib codecs, always available
+register(Codec("bz2", ".bz2", range(1, 10), _bz2_compress, bz2.decompress))
+register(Codec("xz", ".xz", range(10), _xz_compress, lzma.decompress))
+
+if zstandard is not None:
+    register(Codec("zstd", ".zst", range(1, 23), _zstd_compress, _zstd_decompress))
+
+if lz4frame is not None:
+    register(Codec("lz4", ".lz4", range(17), _lz4_compress, lz4frame.decompress))
@@ -1,28 +1,198 @@
 #!/usr/bin/env python
+import glob
+import asyncio
 import inspect
+import resource
 import subprocess as sp
-from os import getpid
-from time import time_ns
+from contextvars import ContextVar
+from multiprocessing.util import Finalize
+from os import getpid, register_at_fork, remove, path as op
+from threading import Lock, get_native_id
+from time import perf_counter_ns
 from functools import wraps
 
+bench_header = "action,file,timestamp,pid,runtime,tid,bytes_in,bytes_out,mbps,rss_delta_kb"
+
+# byte counters of the benchmarked call currently running in this thread or task
+io_metrics = ContextVar("io_metrics", default=None)
+
 
 def setup_bench(file=None):
     try:
         with open(file, "w+") as f:
-            f.write("action,file,timestamp,pid,runtime\n")
+            f.write(f"{bench_header}\n")
+
+        # rows of an earlier run killed before merging them
+        for part in glob.glob(f"{glob.escape(file)}.*.part"):
+            remove(part)
     except Exception as e:
         out_string = f"""
-                     Action\t\tFile\t\t\t\tTimestamp\t\tPID\t\tRuntime
+                     Action\t\tFile\t\t\t\tTimestamp\t\tPID\t\tRuntime\t\tTID\t\tBytes in\tBytes out\tMB/s\t\tRSS delta
                      {'-'*100}
                      """
         print(inspect.cleandoc(out_string))
 
 
+def print_rows(rows):
+    for row in rows:
+        print("\t".join(row.rstrip("\n").split(",")))
+
+
+class Recorder:
+    # Buffers benchmark rows in memory and appends them in batches to a
+    # per-process part file, merged into the benchmark file by merge_bench.
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.lock = Lock()
+        self.buffer = []
+        self.pid = None
+        # the child starts with a fresh lock, another thread of the parent
+        # may have held it at the time of the fork, and without its rows
+        register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        self.lock = Lock()
+        self.buffer = []
+
+    def add(self, bfile, *rows):
+        if bfile is None:
+            print_rows(rows)
+            return
+
+        with self.lock:
+            # first row in this process: flush at exit, which also runs in
+            # multiprocessing workers (their finalizers are reset after the fork)
+            if self.pid != getpid():
+                self.pid = getpid()
+                Finalize(None, self.flush, exitpriority=10)
+
+            self.buffer.extend((bfile, row) for row in rows)
+            full = len(self.buffer) >= self.capacity
+
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            rows, self.buffer = self.buffer, []
+
+        per_file = {}
+        for bfile, row in rows:
+            per_file.setdefault(bfile, []).append(row)
+
+        for bfile, rows in per_file.items():
+            try:
+                with open(part_path(bfile), "a+") as f:
+                    f.write("".join(rows))
+            except Exception:
+                print_rows(rows)
+
+
+recorder = Recorder()
+
+
+def part_path(bfile):
+    return f"{bfile}.{getpid()}.part"
+
+
+def merge_bench(bfile):
+    recorder.flush()
+
+    if bfile is None:
+        return
+
+    parts = sorted(glob.glob(f"{glob.escape(bfile)}.*.part"))
+    with open(bfile, "a+") as f:
+        for part in parts:
+            with open(part) as p:
+                f.write(p.read())
+            remove(part)
+
+
+def record_bytes(bytes_in=0, bytes_out=0):
+    metrics = io_metrics.get()
+    if metrics is not None:
+        metrics["bytes_in"] += bytes_in
+        metrics["bytes_out"] += bytes_out
+
+
+def max_rss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def current_rss():
+    # resident set size in KB
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() // 1024
+    except OSError:
+        return max_rss()
+
+
+def high_water_mark():
+    # peak resident set size in KB, since the last clear_refs on Linux
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return max_rss()
+
+
+# highest mark of the run before the per-call resets of the decorators
+run_peak = {"kb": 0}
+peak_lock = Lock()
+
+
+def peak_rss():
+    # peak in KB since the last reset_peak_rss(run=True)
+    with peak_lock:
+        return max(run_peak["kb"], high_water_mark())
+
+
+def reset_peak_rss(run=True):
+    # a per-call reset keeps the mark reached so far for peak_rss
+    with peak_lock:
+        run_peak["kb"] = 0 if run is True else max(run_peak["kb"], high_water_mark())
+        try:
+            with open("/proc/self/clear_refs", "w") as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def record(name, fp, start, end, bfile, tid="", metrics=None, rss_delta=""):
+    pid = getpid()
+    runtime = (end - start) * 10 ** -9
+
+    bytes_in = bytes_out = mbps = ""
+    if metrics is not None and metrics["bytes_in"] + metrics["bytes_out"] > 0:
+        bytes_in = metrics["bytes_in"]
+        bytes_out = metrics["bytes_out"]
+        # rate over the larger side, i.e. the uncompressed one for codecs
+        mbps = max(bytes_in, bytes_out) / 1024 ** 2 / max(runtime, 1e-9)
+
+    recorder.add(
+        bfile,
+        f"{name}_start,{fp},{start},{pid},,{tid},,,,\n",
+        f"{name}_end,{fp},{end},{pid},{runtime},{tid},{bytes_in},{bytes_out},{mbps},{rss_delta}\n",
+    )
+
+
 # decorator
 def benchmark(func):
     @wraps(func)
     def _benchmark(*args, **kwargs):
-        start = time_ns()
+        metrics = {"bytes_in": 0, "bytes_out": 0}
+        token = io_metrics.set(metrics)
+        # peak over the call, from the RSS at its start. The mark is process
+        # wide: a concurrent call's reset clears the peak reached so far, and
+        # allocations of concurrent calls count towards each other's peak
+        reset_peak_rss(run=False)
+        rss = current_rss()
+        start = perf_counter_ns()
 
         if "fp" not in kwargs:
             kwargs["fp"] = ""
@@ -30,30 +200,67 @@ def benchmark(func):
         try:
             return func(*args, **kwargs)
         finally:
-            end = time_ns()
-            try:
-                with open(kwargs["bfile"], "a+") as f:
-                    f.write(
-                        f"{func.__name__}_start,{kwargs['fp']},{start},{getpid()},\n"
-                    )
-                    f.write(
-                        f"{func.__name__}_end,{kwargs['fp']},{end},{getpid()},{(end-start)*10**-9}\n"
-                    )
-            except Exception as e:
-                out_string = f"""
-                {func.__name__}_start\t{kwargs['fp']}\t{start}\t{getpid()}
-                {func.__name__}_end\t{kwargs['fp']}\t{end}\t{getpid()}\t{(end-start)*10**-9}
-                """
-                print(inspect.cleandoc(out_string))
+            end = perf_counter_ns()
+            io_metrics.reset(token)
+            record(
+                func.__name__,
+                kwargs["fp"],
+                start,
+                end,
+                kwargs.get("bfile"),
+                tid=get_native_id(),
+                metrics=metrics,
+                rss_delta=high_water_mark() - rss,
+            )
 
     return _benchmark
 
 
-def drop_caches():
+# decorator for coroutines
+def abenchmark(func):
+    @wraps(func)
+    async def _benchmark(*args, **kwargs):
+        metrics = {"bytes_in": 0, "bytes_out": 0}
+        token = io_metrics.set(metrics)
+        # peak over the call, as in benchmark
+        reset_peak_rss(run=False)
+        rss = current_rss()
+        start = perf_counter_ns()
+
+        if "fp" not in kwargs:
+            kwargs["fp"] = ""
+
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            end = perf_counter_ns()
+            io_metrics.reset(token)
+            record(
+                func.__name__,
+                kwargs["fp"],
+                start,
+                end,
+                kwargs.get("bfile"),
+                tid=asyncio.current_task().get_name(),
+                metrics=metrics,
+                rss_delta=high_water_mark() - rss,
+            )
+
+    return _benchmark
+
+
+def out_path(fp, bucket, i):
+    if i == 0:
+        return op.join(bucket, f"inc_{i}_{op.basename(fp)}")
+    return op.join(bucket, f"inc_{i}_{'_'.join(op.basename(fp).split('_')[2:])}")
+
+
+def drop_caches(host=None):
     print("** DROPPING CACHES **")
-    out = sp.run(
-        "echo 3 | sudo tee /proc/sys/vm/drop_caches", capture_output=True, shell=True
-    )
+    cmd = "echo 3 | sudo tee /proc/sys/vm/drop_caches"
+    if host is not None:
+        cmd = f"ssh {host} '{cmd}'"
+    out = sp.run(cmd, capture_output=True, shell=True)
     print("STDOUT: ", out.stdout.decode("UTF-8"), end="")
     print("STDERR: ", out.stderr.decode("UTF-8"))
     print("** DROPPING CACHES COMPLETED **")
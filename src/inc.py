@@ -1,43 +1,173 @@
 # /usr/bin/env python
 import dask
-import s3fs
-import gzip
 import click
 import nibabel as nib
 import numpy as np
-from src.helpers import benchmark, setup_bench
-from io import BytesIO
+from src import aio_engine, batch, chunked, clients, compressors, helpers, mapped, nifti
+from src.budget import MemoryBudget, footprints
+from src.blockcache import BlockCache, object_version, parse_tiers
+from src.helpers import benchmark, merge_bench, record_bytes, setup_bench
+from src.intermediates import IntermediateStore
+from src.manifest import Manifest, StaleEntry
+from src.readahead import PrefetchFile
+from src.transfer import (
+    fetch_range,
+    read_ranges,
+    read_gzip_stream,
+    part_size_default,
+    MultipartWriter,
+)
+from glob import glob
 from os import path as op
 from time import time_ns
 
 
-@benchmark
-def reads3(fp, anon, cache, **kwargs):
-
-    fs = s3fs.S3FileSystem(anon=anon)
-    fs.cachable = cache
-    if not fs.exists(fp):
-        fs.invalidate_cache()
+def _reads3(fs, fp, cache, parallel_parts, part_size, block_cache, readahead, manifest):
+    # sizes listed by the manifest or recorded on write need no HEAD request
+    size = manifest.size(fp) if manifest is not None else None
+    info = None
+    if size is None:
+        try:
+            info = fs.info(fp)
+        except FileNotFoundError:
+            # written by another process since the listing was cached
+            fs.invalidate_cache()
+            info = fs.info(fp)
+        size = info["size"]
+
+    # reads of listed objects fail if they changed since the listing
+    fetch = manifest.fetch_range if manifest is not None else fetch_range
+    prefetched = manifest.take(fp) if manifest is not None else None
+
+    if prefetched is not None:
+        return prefetched
+
+    if readahead is True:
+        # consume part_size reads, the request size adapts to the throughput
+        with PrefetchFile(
+            fs, fp, max_inflight=max(parallel_parts, 2), size=size, fetch=fetch
+        ) as f:
+            data = bytearray(f.size)
+            view = memoryview(data)
+            for start in range(0, f.size, part_size):
+                f.readinto(view[start : start + part_size])
+            return data
+
+    if block_cache is not None:
+        # blocks are keyed by the listed ETag, missing ones are fetched
+        # conditionally on it so an overwritten object is looked up again
+        version = manifest.version(fp) if manifest is not None else None
+        if version is None:
+            # resolved once per object rather than for every block
+            version = object_version(info if info is not None else fs.info(fp))
+
+        # blocks shared with other processes and runs through the local cache
+        return read_ranges(
+            fs,
+            fp,
+            parallel_parts,
+            part_size,
+            size=size,
+            fetch=lambda fs, fp, start, end: block_cache.fetch_range(
+                fs, fp, start, end, version=version, fetch=fetch
+            ),
+        )
+
+    if parallel_parts > 1:
+        # concurrent ranged GETs into a single preallocated buffer
+        return read_ranges(fs, fp, parallel_parts, part_size, size=size, fetch=fetch)
 
     if cache is True:
         cache_options = {"cache_storage": "/dev/shm"}
 
         with fs.open(fp, "rb", cache_options=cache_options) as f:
-            data = f.read()
+            return f.read()
 
-    else:
-        with fs.open(fp, "rb") as f:
-            data = f.read()
+    if size is not None:
+        # a single ranged GET, whole-object reads would ask for the size first
+        return fetch(fs, fp, 0, size)
+
+    with fs.open(fp, "rb") as f:
+        return f.read()
+
+
+@benchmark
+def reads3(
+    fp,
+    anon,
+    cache,
+    parallel_parts=1,
+    part_size=part_size_default,
+    block_cache=None,
+    readahead=False,
+    manifest=None,
+    **kwargs,
+):
+
+    fs = clients.get_fs(anon=anon)
+    args = (cache, parallel_parts, part_size, block_cache, readahead, manifest)
 
+    try:
+        data = _reads3(fs, fp, *args)
+    except StaleEntry:
+        # overwritten since it was listed, read again with its current size
+        manifest.stat(fp)
+        data = _reads3(fs, fp, *args)
+
+    record_bytes(len(data), len(data))
     return data
 
 
 @benchmark
-def writes3(out_fp, data, cache, **kwargs):
-    fs = s3fs.S3FileSystem()
-    fs.cachable = cache
+def reads3_stream(
+    fp, anon, cache, parallel_parts=1, part_size=part_size_default, manifest=None, **kwargs
+):
 
-    if cache is True:
+    fs = clients.get_fs(anon=anon)
+
+    prefetched = manifest.take(fp) if manifest is not None else None
+    if prefetched is not None:
+        # already downloaded in full, inflated at once
+        data = compressors.codecs["gzip"].decompress(prefetched)
+        record_bytes(len(prefetched), len(data))
+        return data, len(prefetched)
+
+    size = manifest.size(fp) if manifest is not None else None
+    if size is None:
+        if not fs.exists(fp):
+            fs.invalidate_cache()
+        size = fs.info(fp)["size"]
+
+    # parts are decompressed in order while the following ones are downloading
+    fetch = manifest.fetch_range if manifest is not None else fetch_range
+    try:
+        data = read_gzip_stream(fs, fp, max(parallel_parts, 1), part_size, size, fetch)
+    except StaleEntry:
+        size = manifest.stat(fp)["size"]
+        data = read_gzip_stream(fs, fp, max(parallel_parts, 1), part_size, size, fetch)
+
+    record_bytes(size, len(data))
+    return data, size
+
+
+@benchmark
+def writes3(
+    out_fp, data, cache, parallel_parts=1, part_size=part_size_default, manifest=None, **kwargs
+):
+    fs = clients.get_fs()
+    record_bytes(len(data), len(data))
+
+    # the next iteration reads it back without checking it exists
+    if manifest is not None:
+        manifest.add(out_fp, len(data))
+
+    if parallel_parts > 1:
+        # the image is compressed in full first, its parts are then
+        # uploaded concurrently as soon as they are filled
+        with MultipartWriter(fs, out_fp, parallel_parts, part_size) as f:
+            f.write(data)
+
+    elif cache is True:
         cache_options = {"cache_storage": "/dev/shm"}
         with fs.open(out_fp, "wb", cache_options=cache_options) as f:
             f.write(data)
@@ -47,55 +177,98 @@ def writes3(out_fp, data, cache, **kwargs):
 
 
 @benchmark
-def read(fp, anon=False, cache=False, **kwargs):
+def read(fp, anon=False, cache=False, stream=False, store=None, zero_copy=False, **kwargs):
+
+    # build the array directly over the downloaded buffer
+    decode = nifti.image_from_buffer if zero_copy is True else nifti.from_buffer
 
-    if "file://" not in fp:
+    if store is not None and fp in store:
+        data = store.pop(fp)
+        record_bytes(len(data), len(data))
+        im = decode(data)
+
+    elif "file://" not in fp:
         data = None
+        codec = compressors.codec_for(fp)
 
-        # Cheat way to determine whether to decompress or not
-        if ".gz" in fp[-3:]:
-            data = gzip.decompress(reads3(fp=fp, anon=anon, cache=cache, **kwargs))
+        if codec.name == "gzip" and stream is True:
+            data, size = reads3_stream(fp=fp, anon=anon, cache=cache, **kwargs)
+            record_bytes(size, len(data))
         else:
-            data = reads3(fp=fp, anon=anon, cache=cache, **kwargs)
-
-        fh = nib.FileHolder(fileobj=BytesIO(data))
+            c_data = reads3(fp=fp, anon=anon, cache=cache, **kwargs)
+            data = codec.decompress(c_data)
+            record_bytes(len(c_data), len(data))
 
-        im = nib.Nifti1Image.from_file_map({"header": fh, "image": fh})
+        im = decode(data)
 
     else:
-        im = nib.load(fp.removeprefix("file:/"), lazy=False)
+        im = nib.load(fp.removeprefix("file:/"), mmap=False)
         # just to measure load time to memory
         data = np.asanyarray(im.dataobj)
+        record_bytes(op.getsize(fp.removeprefix("file:/")), data.nbytes)
     return im
 
 
 @benchmark
-def increment(im, fp, **kwargs):
-    data = np.asanyarray(im.dataobj) + 1
-    return nib.Nifti1Image(data, im.affine, im.header)
+def increment(im, fp, inplace=False, **kwargs):
+    return nifti.increment(im, inplace=inplace)
 
 
 @benchmark
-def write(im, fp, bucket, i, cache=False, clevel=9, **kwargs):
+def increment_chunked(
+    fp, bucket, i, anon=False, parallel_parts=1, part_size=part_size_default, **kwargs
+):
+    if compressors.codec_for(fp).name != "none" or "file://" in fp + bucket:
+        raise ValueError(f"{fp}: chunked mode needs uncompressed inputs and outputs on s3")
 
-    if i == 0:
-        out_fp = op.join(bucket, f"inc_{i}_{op.basename(fp)}")
-    else:
-        out_fp = op.join(bucket, f"inc_{i}_{'_'.join(op.basename(fp).split('_')[2:])}")
+    # read, increment and upload slabs along the slowest axis with dask.array
+    fs = clients.get_fs(anon=anon)
+    return chunked.increment(fs, fp, helpers.out_path(fp, bucket, i), parallel_parts, part_size)
 
-    if "file://" not in bucket:
-        bio = BytesIO()
-        file_map = im.make_file_map({"image": bio, "header": bio})
-        im.to_file_map(file_map)
 
-        if ".gz" in fp[-3:]:
-            data = gzip.compress(bio.getvalue(), compresslevel=clevel)
-        else:
-            data = bio.getvalue()
+@benchmark
+def increment_mmap(fp, bucket, i, part_size=part_size_default, **kwargs):
+    if compressors.codec_for(fp).name != "none" or "file://" not in fp or "file://" not in bucket:
+        raise ValueError(f"{fp}: mmap mode needs uncompressed local inputs and outputs")
+
+    # input mapped read-only, increment written straight into the mapped output
+    out_fp = helpers.out_path(fp, bucket, i)
+    size = mapped.increment(
+        fp.removeprefix("file:/"), out_fp.removeprefix("file:/"), chunk_size=part_size
+    )
+    record_bytes(size, size)
+    return out_fp
+
+
+@benchmark
+def write(
+    im, fp, bucket, i, cache=False, clevel=9, threads=1, store=None, persist=True, **kwargs
+):
+
+    out_fp = helpers.out_path(fp, bucket, i)
+
+    raw = None
+    kept = False
+
+    # intermediates are kept uncompressed for the next iteration to read
+    if store is not None:
+        raw = nifti.to_buffer(im)
+        kept = store.put(out_fp, raw)
+
+    if persist is False and kept is True:
+        record_bytes(len(raw), len(raw))
+        return out_fp
+
+    if "file://" not in bucket:
+        codec = compressors.codec_for(fp)
+        raw = raw or nifti.to_buffer(im)
+        data = codec.compress(raw, clevel=clevel, threads=threads)
 
         writes3(out_fp, data=data, cache=cache, fp=fp, **kwargs)
+        record_bytes(len(raw), len(data))
     else:
         nib.save(im, out_fp.removeprefix("file:/"))
+        record_bytes(np.asanyarray(im.dataobj).nbytes, op.getsize(out_fp.removeprefix("file:/")))
 
     return out_fp
 
@@ -105,7 +278,35 @@ def write(im, fp, bucket, i, cache=False, clevel=9, **kwargs):
 @click.argument("output_bucket", type=str)
 @click.option("--it", type=int, default=1, help="Number of iterations")
 @click.option("--cache", is_flag=True, help="enable file caching")
+@click.option(
+    "--block_cache",
+    type=str,
+    default=None,
+    help="cache ranged reads in local tiers, e.g. /dev/shm/s3cache:2048,/tmp/s3cache:10240 (MB)",
+)
+@click.option(
+    "--readahead",
+    is_flag=True,
+    help="read sequentially with an adaptive readahead window",
+)
 @click.option("--n_files", type=int, default=1, help="Number of files to process")
+@click.option(
+    "--manifest_dir",
+    type=str,
+    default=None,
+    help="keep an index of the input keys, sizes and ETags here instead of listing every run",
+)
+@click.option(
+    "--refresh_manifest",
+    is_flag=True,
+    help="list the whole input prefix again instead of only the keys after the indexed ones",
+)
+@click.option(
+    "--prefetch",
+    type=int,
+    default=0,
+    help="Number of listed inputs downloaded in the background while the pipeline starts",
+)
 @click.option(
     "--compression_level",
     type=click.Choice([str(i) for i in range(10)]),
@@ -123,16 +324,146 @@ def write(im, fp, bucket, i, cache=False, clevel=9, **kwargs):
    help="Is a publicly available s3 dataset"
 )
 @click.option("--use_dask", is_flag=True, help="run as a dask pipeline")
+@click.option(
+    "--engine",
+    type=click.Choice(["sequential", "dask", "asyncio"]),
+    default=None,
+    help="Execution engine. Defaults to dask with --use_dask, sequential otherwise",
+)
+@click.option(
+    "--max_inflight",
+    type=int,
+    default=4,
+    help="Number of files processed concurrently by the asyncio engine",
+)
+@click.option(
+    "--cpu_workers",
+    type=int,
+    default=None,
+    help="Size of the executor running cpu work in the asyncio engine",
+)
+@click.option(
+    "--parallel_parts",
+    type=int,
+    default=1,
+    help="Number of concurrent ranged requests or upload parts per object",
+)
+@click.option(
+    "--part_size",
+    type=int,
+    default=part_size_default,
+    help="Size in bytes of each ranged request or upload part",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    help="decompress gzipped inputs while they are being downloaded",
+)
+@click.option(
+    "--compress_threads",
+    type=int,
+    default=1,
+    help="Number of threads used to compress outputs",
+)
+@click.option(
+    "--keep_intermediates",
+    is_flag=True,
+    help="keep intermediate iterations in memory instead of writing them out",
+)
+@click.option(
+    "--checkpoint_every",
+    type=int,
+    default=0,
+    help="Also persist every k-th intermediate iteration (0 to only persist the last)",
+)
+@click.option(
+    "--mem_limit",
+    type=int,
+    default=1024,
+    help="Memory available to intermediates in MB",
+)
+@click.option(
+    "--spill_limit",
+    type=int,
+    default=0,
+    help="Space available to intermediates in /dev/shm in MB once memory is full",
+)
+@click.option(
+    "--mem_budget",
+    type=int,
+    default=0,
+    help="Memory in MB shared by the files the dask engine runs at once (0 for no limit)",
+)
+@click.option(
+    "--max_pool",
+    type=int,
+    default=10,
+    help="Maximum number of pooled connections of the shared S3 client",
+)
+@click.option(
+    "--endpoint_url",
+    type=str,
+    default=None,
+    help="S3 endpoint to use instead of AWS, e.g. a local stand-in",
+)
+@click.option(
+    "--zero_copy",
+    is_flag=True,
+    help="decode images directly from the download buffer",
+)
+@click.option("--inplace", is_flag=True, help="increment images in place")
+@click.option(
+    "--chunked",
+    "chunked_inc",
+    is_flag=True,
+    help="stream chunks of each image through a dask.array increment",
+)
+@click.option(
+    "--mmap",
+    "mmap_io",
+    is_flag=True,
+    help="increment uncompressed local images through memory mappings of the files",
+)
+@click.option(
+    "--batch_size",
+    type=int,
+    default=0,
+    help="increment up to this many same-layout images in one vectorised pass",
+)
 def main(
     input_bucket_rgx,
     output_bucket,
     it,
     cache,
+    block_cache,
+    readahead,
     n_files,
+    manifest_dir,
+    refresh_manifest,
+    prefetch,
     compression_level,
     bench_file,
     use_dask,
-    anon
+    engine,
+    max_inflight,
+    cpu_workers,
+    anon,
+    parallel_parts,
+    part_size,
+    stream,
+    compress_threads,
+    keep_intermediates,
+    checkpoint_every,
+    mem_limit,
+    spill_limit,
+    mem_budget,
+    max_pool,
+    endpoint_url,
+    zero_copy,
+    inplace,
+    chunked_inc,
+    mmap_io,
+    batch_size,
 ):
 
     # potentially create another decorate or fix the benchmark one for this
@@ -143,55 +474,173 @@ def main(
     makespan_dir = op.dirname(bench_file)
     bench_name = op.basename(bench_file)
 
-    fs = s3fs.S3FileSystem(anon=anon)
-    fs.cachable = cache
-    all_f = fs.glob(input_bucket_rgx)
+    clients.configure(max_pool=max_pool, endpoint_url=endpoint_url)
+    fs = clients.get_fs(anon=anon)
+
+    if engine is None:
+        engine = "dask" if use_dask is True else "sequential"
+    use_dask = engine == "dask"
+
+    manifest = None
+    if manifest_dir is not None and "file://" not in input_bucket_rgx:
+        manifest = Manifest(
+            fs, input_bucket_rgx, manifest_dir, endpoint_url=clients.config["endpoint_url"]
+        ).open(refresh=refresh_manifest)
+        files = manifest.files(n_files)
+
+        # only the read stage of the per-file pipeline takes prefetched objects
+        if prefetch > 0 and engine != "asyncio" and batch_size == 0 and not chunked_inc:
+            manifest.prefetch(files[:prefetch], workers=min(prefetch, max_pool))
+    elif "file://" in input_bucket_rgx:
+        # local inputs, e.g. on tmpfs or NVMe
+        pattern = input_bucket_rgx.removeprefix("file:/")
+        files = ["file:/" + fp for fp in sorted(glob(pattern))][:n_files]
+    else:
+        files = fs.glob(input_bucket_rgx)[:n_files]
 
-    files = all_f[:n_files]
     outfiles = []
     clevel = int(compression_level)
 
-    for fp in files:
-        for i in range(it):
+    if block_cache is not None:
+        block_cache = BlockCache(parse_tiers(block_cache))
+
+    store = None
+    if keep_intermediates is True:
+        store = IntermediateStore(
+            mem_limit * 1024 ** 2, spill_dir="/dev/shm", spill_limit=spill_limit * 1024 ** 2
+        )
+
+    read_kwargs = {
+        "cache": cache,
+        "block_cache": block_cache,
+        "readahead": readahead,
+        "stream": stream,
+        "store": store,
+        "zero_copy": zero_copy,
+        "parallel_parts": parallel_parts,
+        "part_size": part_size,
+        "manifest": manifest,
+        "bfile": bench_file,
+    }
+    write_kwargs = {
+        "bucket": output_bucket,
+        "cache": cache,
+        "clevel": clevel,
+        "threads": compress_threads,
+        "parallel_parts": parallel_parts,
+        "part_size": part_size,
+        "manifest": manifest,
+        "bfile": bench_file,
+    }
+    task = dask.delayed if use_dask is True else lambda func: func
+
+    budget = None
+    if mem_budget > 0 and use_dask is True and not chunked_inc and not mmap_io:
+        budget = MemoryBudget(mem_budget * 1024 ** 2)
+        # headers of compressed inputs are fetched while the graph is built
+        sizes = [manifest.size(fp) for fp in files] if manifest is not None else None
+        needs = footprints(fs, files, sizes, workers=max_pool)
+
+    if engine == "asyncio":
+        # reads and writes go through the async s3 api, cpu work to an executor
+        outfiles = aio_engine.run(
+            files,
+            it,
+            output_bucket,
+            anon=anon,
+            max_inflight=max_inflight,
+            cpu_workers=cpu_workers,
+            bfile=bench_file,
+            zero_copy=zero_copy,
+            inplace=inplace,
+            clevel=clevel,
+            threads=compress_threads,
+        )
+
+    elif batch_size > 0:
+        # same-layout volumes stacked and incremented together
+        outfiles = batch.run(
+            files,
+            it,
+            output_bucket,
+            anon=anon,
+            batch_size=batch_size,
+            clevel=clevel,
+            threads=compress_threads,
+            bfile=bench_file,
+        )
 
-            if use_dask is True:
-                im = dask.delayed(read)(fp=fp, anon=anon, cache=cache, bfile=bench_file)
-                inc = dask.delayed(increment)(im=im, fp=fp, bfile=bench_file)
-                fp = dask.delayed(write)(
-                    im=inc,
-                    fp=fp,
-                    bucket=output_bucket,
-                    i=i,
-                    cache=cache,
-                    clevel=clevel,
-                    bfile=bench_file,
-                )
-            else:
-                im = read(fp=fp, anon=anon, cache=cache, bfile=bench_file)
-                inc = increment(im=im, fp=fp, bfile=bench_file)
-                fp = write(
+    else:
+        for fp in files:
+            for i in range(it):
+                if chunked_inc is True:
+                    fp = increment_chunked(
+                        fp=fp,
+                        bucket=output_bucket,
+                        i=i,
+                        anon=anon,
+                        parallel_parts=parallel_parts,
+                        part_size=part_size,
+                        bfile=bench_file,
+                    )
+                    anon = False
+                    continue
+
+                if mmap_io is True:
+                    fp = increment_mmap(
+                        fp=fp, bucket=output_bucket, i=i, part_size=part_size, bfile=bench_file
+                    )
+                    continue
+
+                last = i == it - 1
+                checkpoint = checkpoint_every > 0 and (i + 1) % checkpoint_every == 0
+
+                im = task(read)(fp=fp, anon=anon, **read_kwargs)
+                inc = task(increment)(im=im, fp=fp, inplace=inplace, bfile=bench_file)
+                fp = task(write)(
                     im=inc,
                     fp=fp,
-                    bucket=output_bucket,
                     i=i,
-                    cache=cache,
-                    clevel=clevel,
-                    bfile=bench_file,
+                    store=None if last else store,
+                    persist=store is None or last or checkpoint,
+                    **write_kwargs,
                 )
-            anon = False
+                anon = False
 
-        outfiles.append(fp)
+            outfiles.append(fp)
 
-    if use_dask is True:
-        outfiles = dask.delayed(lambda x: x)(outfiles).compute()
+        if use_dask is True and budget is not None:
+            # a file's chain starts once its estimated footprint fits
+            outfiles = budget.compute(outfiles, needs)
+        elif use_dask is True:
+            outfiles = dask.delayed(lambda x: x)(outfiles).compute()
 
     print(", ".join(outfiles))
 
+    # collect the rows buffered by every process
+    merge_bench(bench_file)
+
+    if store is not None:
+        store.clear()
+
     end = time_ns()
 
     with open(op.join(makespan_dir, "makespan.csv"), "a+") as f:
         f.write(f"{bench_name},{start},{end},{(end-start)*10**-9}\n")
 
+    with open(op.join(makespan_dir, "peak_rss.csv"), "a+") as f:
+        peak_admitted = budget.peak if budget is not None else ""
+        f.write(f"{bench_name},{helpers.peak_rss()},{mem_budget},{peak_admitted}\n")
+
+    clients.write_stats(makespan_dir, bench_name)
+
+    if block_cache is not None:
+        block_cache.write_stats(makespan_dir, bench_name)
+
+    if manifest is not None:
+        manifest.close()
+        manifest.write_stats(makespan_dir, bench_name)
+
 
 if __name__ == "__main__":
     main()
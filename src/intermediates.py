@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+import hashlib
+from os import getpid, remove, path as op
+from threading import Lock
+
+
+class IntermediateStore:
+    # Keeps intermediate outputs in memory, spilling to spill_dir once
+    # mem_limit bytes are used. put() returns False when both are full.
+    def __init__(self, mem_limit, spill_dir="/dev/shm", spill_limit=0):
+        self.mem_limit = mem_limit
+        self.spill_dir = spill_dir
+        self.spill_limit = spill_limit
+        self.mem = {}
+        self.spilled = {}
+        self.mem_used = 0
+        self.spill_used = 0
+        self.lock = Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.mem or key in self.spilled
+
+    def _spill_path(self, key):
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return op.join(self.spill_dir, f".s3bench-{getpid()}-{name}")
+
+    def put(self, key, data):
+        size = len(data)
+
+        with self.lock:
+            if self.mem_used + size <= self.mem_limit:
+                self.mem[key] = data
+                self.mem_used += size
+                return True
+
+            if self.spill_used + size > self.spill_limit:
+                return False
+
+            # reserved now, the key is only listed once its file is complete
+            self.spill_used += size
+
+        spill_fp = self._spill_path(key)
+        try:
+            with open(spill_fp, "wb") as f:
+                f.write(data)
+        except OSError:
+            with self.lock:
+                self.spill_used -= size
+            if op.exists(spill_fp):
+                remove(spill_fp)
+            return False
+
+        with self.lock:
+            self.spilled[key] = size
+
+        return True
+
+    def pop(self, key):
+        with self.lock:
+            if key in self.mem:
+                data = self.mem.pop(key)
+                self.mem_used -= len(data)
+                return data
+
+            size = self.spilled.pop(key)
+            self.spill_used -= size
+
+        spill_fp = self._spill_path(key)
+        with open(spill_fp, "rb") as f:
+            data = f.read()
+        remove(spill_fp)
+
+        return data
+
+    def clear(self):
+        with self.lock:
+            for key in self.spilled:
+                remove(self._spill_path(key))
+            self.mem = {}
+            self.spilled = {}
+            self.mem_used = 0
+            self.spill_used = 0
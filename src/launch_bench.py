@@ -1,30 +1,37 @@
 #!/usr/bin/env python
 import click
 import json
-import s3fs
-import glob
+import shlex
 import shutil
 import subprocess as sp
-from os import makedirs, path as op
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from os import getcwd, getpid, makedirs, remove, walk, path as op
 from pathlib import PurePath
+from queue import Empty, Queue
 from random import shuffle
-from src import helpers
+from tempfile import TemporaryDirectory, gettempdir
+from threading import Lock, Thread
+from src import cleanup, clients, helpers, worker
 
 executable = "src/inc.py"
+completed_fn = "completed.csv"
 
 
-def clear_bucket(bucket):
+def clear_bucket(bucket, workers=4):
+    # batched deletes of every key under the bucket or prefix
+    return cleanup.clear_prefix(clients.get_fs(), bucket, workers)
 
-    # bucket = op.join(bucket)
-    fs = s3fs.S3FileSystem()
 
-    # Get list of files to delete
-    files = fs.ls(bucket)
+def pin_cpus(slot, cpus_per_job):
+    # pin each concurrent job of a host to its own set of cores
+    if cpus_per_job == 0:
+        return []
+    first = slot * cpus_per_job
+    return ["taskset", "-c", f"{first}-{first + cpus_per_job - 1}"]
 
-    fs.rm(files)
 
-
-def launch_command(exp):
+def strip_flags(exp):
     # remove second to last and last element of list if empty
     if exp[-3] == "":
         exp = exp[0:-3] + exp[-2:]
@@ -32,6 +39,13 @@ def launch_command(exp):
         exp = exp[0:-2] + [exp[-1]]
     if exp[-1] == "":
         exp = exp[0:-1]
+    return exp
+
+
+def launch_command(exp, prefix=(), host=None, remote_dir=None):
+    exp = list(prefix) + strip_flags(exp)
+    if host is not None:
+        exp = ["ssh", host, f"cd {shlex.quote(remote_dir or getcwd())} && {shlex.join(exp)}"]
 
     print("Launching command: ", " ".join([el for el in exp]))
     out = sp.run(args=exp, capture_output=True)
@@ -39,6 +53,164 @@ def launch_command(exp):
     print("STDOUT: ", out.stdout.decode("utf-8"))
     print("STDERR: ", out.stderr.decode("utf-8"))
     print("Command completed")
+    return out.returncode
+
+
+def remote_path(fp, remote_dir=None):
+    # experiments run from remote_dir, relative paths resolve against it
+    return op.join(remote_dir or getcwd(), fp)
+
+
+def make_remote_dirs(host, fldrs, remote_dir=None):
+    paths = " ".join(shlex.quote(remote_path(fldr, remote_dir)) for fldr in fldrs)
+    sp.run(["ssh", host, f"mkdir -p {paths}"], check=True)
+
+
+def fetch_results(host, fldr, lock, remote_dir=None):
+    # results are moved off the host, so the next wave starts from empty
+    # files and rows shared by experiments (makespan.csv...) are appended once
+    with TemporaryDirectory() as tmp:
+        sp.run(
+            [
+                "rsync",
+                "-a",
+                "--remove-source-files",
+                f"{host}:{remote_path(fldr, remote_dir)}/",
+                tmp,
+            ],
+            check=True,
+        )
+
+        with lock:
+            for root, _, names in walk(tmp):
+                out_dir = op.join(fldr, op.relpath(root, tmp))
+                makedirs(out_dir, exist_ok=True)
+                for name in sorted(names):
+                    with open(op.join(root, name)) as src:
+                        with open(op.join(out_dir, name), "a+") as dst:
+                            dst.write(src.read())
+
+
+def check_results(host, wave):
+    # on a shared filesystem, the host writes the benchmark files in place
+    missing = [exp[-4] for _, exp, _ in wave if not op.exists(exp[-4])]
+    if len(missing) > 0:
+        raise FileNotFoundError(
+            f"results of {host} are not on the shared filesystem, e.g. {missing[0]}"
+        )
+
+
+def start_workers(n_workers, cpus_per_job):
+    # resident processes importing the benchmark dependencies once for the sweep
+    procs, sockets = [], []
+    for slot in range(n_workers):
+        socket_path = op.join(gettempdir(), f"s3bench-worker-{getpid()}-{slot}.sock")
+        cmd = pin_cpus(slot, cpus_per_job) + [sys.executable, "-m", "src.worker", socket_path]
+        procs.append(sp.Popen(cmd))
+        sockets.append(socket_path)
+
+    for socket_path in sockets:
+        worker.wait_ready(socket_path)
+
+    return procs, sockets
+
+
+def stop_workers(procs, sockets):
+    for proc, socket_path in zip(procs, sockets):
+        if proc.poll() is None:
+            worker.submit(socket_path, {"cmd": "shutdown"})
+        proc.wait()
+
+
+def launch_worker(exp, socket_path):
+    # same experiment, without the interpreter start and imports
+    exp = strip_flags(exp)
+
+    print(f"Launching on worker {socket_path}: ", " ".join([el for el in exp]))
+    out = worker.submit(socket_path, {"argv": exp[2:]})
+
+    print("OUTPUT: ", out["output"])
+    print("Command completed")
+    return out["returncode"]
+
+
+def load_completed(results_fldr):
+    completed = set()
+    fp = op.join(results_fldr, completed_fn)
+
+    if op.exists(fp):
+        with open(fp) as f:
+            for line in f:
+                rep, bench_name, returncode = line.strip().split(",")
+                if returncode == "0":
+                    completed.add((int(rep), bench_name))
+
+    return completed
+
+
+def run_host(
+    host,
+    jobs,
+    results_fldr,
+    workers,
+    cpus_per_job,
+    remote_dir,
+    lock,
+    cleaner,
+    sockets=None,
+    shared_fs=False,
+):
+    while True:
+        wave = []
+        while len(wave) < workers:
+            try:
+                wave.append(jobs.get_nowait())
+            except Empty:
+                break
+
+        if len(wave) == 0:
+            return
+
+        # an earlier repetition may still be deleting the same outputs
+        for _, _, out_prefix in wave:
+            cleaner.wait(out_prefix)
+
+        out_dirs = [p.removeprefix("file:/") for _, _, p in wave if "file://" in p]
+        bench_fldrs = sorted({op.dirname(exp[-4]) for _, exp, _ in wave})
+        if host is None:
+            for out_dir in out_dirs:
+                makedirs(out_dir, exist_ok=True)
+        else:
+            # local outputs are on the host's own disks
+            remote_dirs = out_dirs + (bench_fldrs if shared_fs is False else [])
+            if len(remote_dirs) > 0:
+                make_remote_dirs(host, remote_dirs, remote_dir)
+
+        # caches are dropped while none of this host's jobs are running, so
+        # every job of a wave starts cold
+        helpers.drop_caches(host)
+
+        def _launch(slot):
+            if sockets is not None:
+                return launch_worker(wave[slot][1], sockets[slot])
+            return launch_command(wave[slot][1], pin_cpus(slot, cpus_per_job), host, remote_dir)
+
+        with ThreadPoolExecutor(max_workers=len(wave)) as executor:
+            returncodes = list(executor.map(_launch, range(len(wave))))
+
+        if host is not None and shared_fs is False:
+            for fldr in bench_fldrs:
+                fetch_results(host, fldr, lock, remote_dir)
+        elif host is not None:
+            check_results(host, wave)
+
+        # delete the outputs of this wave only, others may still be running
+        cleaner.clear([(out_prefix, exp[-4]) for _, exp, out_prefix in wave], host=host)
+
+        for (rep, exp, out_prefix), returncode in zip(wave, returncodes):
+            with lock:
+                with open(op.join(results_fldr, completed_fn), "a+") as f:
+                    f.write(f"{rep},{op.basename(exp[-4])},{returncode}\n")
 
 
 def gen_benchfile(bucket, it, files, cache, use_dask):
@@ -56,7 +228,70 @@ def gen_benchfile(bucket, it, files, cache, use_dask):
 @click.argument("condition_json", type=click.File())
 @click.argument("results_fldr", type=str)
 @click.option("--repetitions", type=int, default=5, help="number of repetitions to run")
-def main(condition_json, results_fldr, repetitions):
+@click.option(
+    "--workers", type=int, default=1, help="number of experiments run concurrently per host"
+)
+@click.option(
+    "--host",
+    "hosts",
+    type=str,
+    multiple=True,
+    help="run experiments on this host through ssh. Can be repeated. Local otherwise",
+)
+@click.option(
+    "--remote_dir",
+    type=str,
+    default=None,
+    help="repository path on the remote hosts. Current directory by default",
+)
+@click.option(
+    "--shared_fs",
+    is_flag=True,
+    help="remote hosts write results to results_fldr through a shared filesystem. "
+    "Otherwise they are copied back with rsync after every wave",
+)
+@click.option(
+    "--cpus_per_job",
+    type=int,
+    default=0,
+    help="pin every concurrent experiment to its own set of this many cpus",
+)
+@click.option(
+    "--resume", is_flag=True, help="skip experiments completed by a previous sweep"
+)
+@click.option(
+    "--persistent",
+    is_flag=True,
+    help="run experiments in resident local workers instead of new interpreters",
+)
+@click.option(
+    "--cleanup_workers",
+    type=int,
+    default=4,
+    help="number of output prefixes, and delete requests per prefix, cleaned up concurrently",
+)
+@click.option(
+    "--background_cleanup",
+    is_flag=True,
+    help="delete outputs while the next experiments start instead of in between",
+)
+def main(
+    condition_json,
+    results_fldr,
+    repetitions,
+    workers,
+    hosts,
+    remote_dir,
+    shared_fs,
+    cpus_per_job,
+    resume,
+    persistent,
+    cleanup_workers,
+    background_cleanup,
+):
+    if persistent is True and len(hosts) > 0:
+        raise click.UsageError("--persistent workers only run on the local host")
+
     conditions = json.load(condition_json)
     out_bucket = conditions["out_bucket"]
     in_bucket = []
@@ -104,6 +339,58 @@ def main(condition_json, results_fldr, repetitions):
         for d in dask[x]
     ]
 
+    makedirs(results_fldr, exist_ok=True)
+    completed = set()
+    if resume is True:
+        completed = load_completed(results_fldr)
+    elif op.exists(op.join(results_fldr, completed_fn)):
+        remove(op.join(results_fldr, completed_fn))
+
+    lock = Lock()
+    cleaner = cleanup.Cleaner(cleanup_workers, background=background_cleanup)
+
+    procs, sockets = [], None
+    if persistent is True:
+        procs, sockets = start_workers(workers, cpus_per_job)
+
+    try:
+        run_sweep(
+            exp,
+            out_bucket,
+            results_fldr,
+            repetitions,
+            completed,
+            resume,
+            hosts,
+            workers,
+            cpus_per_job,
+            remote_dir,
+            lock,
+            cleaner,
+            sockets,
+            shared_fs,
+        )
+    finally:
+        cleaner.shutdown()
+        stop_workers(procs, sockets or [])
+
+
+def run_sweep(
+    exp,
+    out_bucket,
+    results_fldr,
+    repetitions,
+    completed,
+    resume,
+    hosts,
+    workers,
+    cpus_per_job,
+    remote_dir,
+    lock,
+    cleaner,
+    sockets,
+    shared_fs=False,
+):
     for r in range(repetitions):
 
         # randomize experiment executions
@@ -112,27 +399,48 @@ def main(condition_json, results_fldr, repetitions):
         # fix results folder
         rep_fldr = op.join(results_fldr, f"rep-{r}")
 
-        if op.exists(rep_fldr):
+        if op.exists(rep_fldr) and resume is False:
             shutil.rmtree(rep_fldr)
-        makedirs(rep_fldr)
+        makedirs(rep_fldr, exist_ok=True)
 
-        # run experiments
+        jobs = Queue()
         for e in exp:
+            bench_name = op.basename(e[-4])
+            if (r, bench_name) in completed:
+                continue
 
+            # every experiment writes to, and cleans up, its own output prefix
+            out_prefix = op.join(out_bucket, op.splitext(bench_name)[0])
+
+            e = list(e)
+            e[3] = out_prefix
             # fix benchmark file name
-            e[-4] = op.join(rep_fldr, op.basename(e[-4]))
-
-            # Clear cache before launching
-            helpers.drop_caches()
-            launch_command(e)
-
-            # delete s3 bucket contents post execution
-            if "file://" not in out_bucket:
-                clear_bucket(out_bucket)
-            else:
-                for f in glob.glob(op.join(out_bucket.removeprefix("file:/"), "*.nii")):
-                    print(f"removing file {f}")
-                    os.remove(f)
+            e[-4] = op.join(rep_fldr, bench_name)
+            jobs.put((r, e, out_prefix))
+
+        # every host takes experiments from the shuffled queue as it frees up
+        threads = [
+            Thread(
+                target=run_host,
+                args=(
+                    host,
+                    jobs,
+                    results_fldr,
+                    workers,
+                    cpus_per_job,
+                    remote_dir,
+                    lock,
+                    cleaner,
+                    sockets,
+                    shared_fs,
+                ),
+            )
+            for host in (hosts or [None])
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
 
 
 if __name__ == "__main__":
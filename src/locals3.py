@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+import hashlib
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree as ET
+
+# Minimal S3-compatible server covering the calls made by s3fs in this repo:
+# bucket listing/creation, object get (with ranges and If-Match), head, put,
+# delete, multi-object delete and multipart uploads. Requests can be slowed
+# down with a fixed latency and a per-connection bandwidth limit.
+
+xmlns = "http://s3.amazonaws.com/doc/2006-03-01/"
+send_size = 64 * 1024
+
+
+def _isotime(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(t))
+
+
+def _etag(data):
+    return f'"{hashlib.md5(data).hexdigest()}"'
+
+
+def _decode_aws_chunked(body):
+    # <hex size>[;chunk-signature=...]\r\n<data>\r\n ... 0\r\n<trailers>\r\n\r\n
+    out = bytearray()
+    pos = 0
+    while True:
+        eol = body.index(b"\r\n", pos)
+        size = int(body[pos:eol].split(b";")[0], 16)
+        if size == 0:
+            return bytes(out)
+        out += body[eol + 2 : eol + 2 + size]
+        pos = eol + 2 + size + 2
+
+
+class S3Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def s3(self):
+        return self.server.s3
+
+    def parse(self):
+        time.sleep(self.s3.latency)
+        url = urlsplit(self.path)
+        parts = unquote(url.path).lstrip("/").split("/", 1)
+        bucket = parts[0]
+        key = parts[1] if len(parts) > 1 else ""
+        return bucket, key, parse_qs(url.query, keep_blank_values=True)
+
+    def read_body(self):
+        if self.headers.get("Transfer-Encoding", "") == "chunked":
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                if size == 0:
+                    self.rfile.readline()
+                    break
+                body += self.throttled_read(size)
+                self.rfile.readline()
+            body = bytes(body)
+        else:
+            body = self.throttled_read(int(self.headers.get("Content-Length", 0)))
+
+        if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+            body = _decode_aws_chunked(body)
+        return body
+
+    def throttled_read(self, n):
+        chunks = []
+        while n > 0:
+            chunk = self.rfile.read(min(n, send_size))
+            self.s3.throttle(len(chunk))
+            chunks.append(chunk)
+            n -= len(chunk)
+        return b"".join(chunks)
+
+    def respond(self, status, body=b"", headers=None, send_body=True):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if send_body:
+            view = memoryview(body)
+            for i in range(0, len(view), send_size):
+                self.wfile.write(view[i : i + send_size])
+                self.s3.throttle(min(send_size, len(view) - i))
+
+    def respond_xml(self, status, root):
+        body = b'<?xml version="1.0" encoding="UTF-8"?>' + ET.tostring(root)
+        self.respond(status, body, {"Content-Type": "application/xml"})
+
+    def error(self, status, code, send_body=True):
+        body = f"<Error><Code>{code}</Code><Message>{code}</Message></Error>".encode()
+        self.respond(status, body, {"Content-Type": "application/xml"}, send_body)
+
+    def do_HEAD(self):
+        bucket, key, query = self.parse()
+
+        if bucket not in self.s3.buckets:
+            return self.error(404, "NoSuchBucket", send_body=False)
+        if key == "":
+            return self.respond(200)
+
+        obj = self.s3.get_object(bucket, key)
+        if obj is None:
+            return self.error(404, "NoSuchKey", send_body=False)
+
+        data, etag, mtime = obj
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(mtime, usegmt=True))
+        self.end_headers()
+
+    def do_GET(self):
+        bucket, key, query = self.parse()
+
+        if bucket == "":
+            return self.list_buckets()
+        if bucket not in self.s3.buckets:
+            return self.error(404, "NoSuchBucket")
+        if key == "":
+            if "location" in query:
+                root = ET.Element("LocationConstraint", xmlns=xmlns)
+                return self.respond_xml(200, root)
+            return self.list_objects(bucket, query)
+
+        obj = self.s3.get_object(bucket, key)
+        if obj is None:
+            return self.error(404, "NoSuchKey")
+
+        data, etag, mtime = obj
+        if_match = self.headers.get("If-Match")
+        if if_match is not None and if_match.strip('"') != etag.strip('"'):
+            return self.error(412, "PreconditionFailed")
+
+        headers = {"ETag": etag, "Last-Modified": formatdate(mtime, usegmt=True)}
+        byte_range = self.headers.get("Range")
+
+        if byte_range is None:
+            return self.respond(200, data, headers)
+
+        start, end = byte_range.removeprefix("bytes=").split("-")
+        if start == "":
+            start, end = max(len(data) - int(end), 0), len(data) - 1
+        else:
+            start = int(start)
+            end = len(data) - 1 if end == "" else min(int(end), len(data) - 1)
+
+        if start >= len(data):
+            return self.error(416, "InvalidRange")
+
+        headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+        self.respond(206, data[start : end + 1], headers)
+
+    def do_PUT(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+
+        if key == "":
+            self.s3.create_bucket(bucket)
+            return self.respond(200)
+        if bucket not in self.s3.buckets:
+            return self.error(404, "NoSuchBucket")
+
+        if "uploadId" in query:
+            upload_id = query["uploadId"][0]
+            if upload_id not in self.s3.uploads:
+                return self.error(404, "NoSuchUpload")
+            etag = _etag(body)
+            self.s3.uploads[upload_id][int(query["partNumber"][0])] = body
+            return self.respond(200, headers={"ETag": etag})
+
+        etag = self.s3.put_object(bucket, key, body)
+        self.respond(200, headers={"ETag": etag})
+
+    def do_POST(self):
+        bucket, key, query = self.parse()
+        body = self.read_body()
+
+        if bucket not in self.s3.buckets:
+            return self.error(404, "NoSuchBucket")
+
+        if "delete" in query:
+            return self.delete_objects(bucket, body)
+
+        if "uploads" in query:
+            upload_id = self.s3.create_upload()
+            root = ET.Element("InitiateMultipartUploadResult", xmlns=xmlns)
+            ET.SubElement(root, "Bucket").text = bucket
+            ET.SubElement(root, "Key").text = key
+            ET.SubElement(root, "UploadId").text = upload_id
+            return self.respond_xml(200, root)
+
+        if "uploadId" in query:
+            parts = self.s3.uploads.pop(query["uploadId"][0], None)
+            if parts is None:
+                return self.error(404, "NoSuchUpload")
+
+            numbers = [
+                int(el.text) for el in ET.fromstring(body).iter() if el.tag.endswith("PartNumber")
+            ]
+
+            etag = self.s3.put_object(bucket, key, b"".join(parts[n] for n in numbers))
+            root = ET.Element("CompleteMultipartUploadResult", xmlns=xmlns)
+            ET.SubElement(root, "Bucket").text = bucket
+            ET.SubElement(root, "Key").text = key
+            ET.SubElement(root, "ETag").text = etag
+            return self.respond_xml(200, root)
+
+        self.error(400, "InvalidRequest")
+
+    def do_DELETE(self):
+        bucket, key, query = self.parse()
+
+        if "uploadId" in query:
+            self.s3.uploads.pop(query["uploadId"][0], None)
+        elif key == "":
+            self.s3.buckets.pop(bucket, None)
+        else:
+            self.s3.delete_object(bucket, key)
+
+        self.respond(204)
+
+    def list_buckets(self):
+        root = ET.Element("ListAllMyBucketsResult", xmlns=xmlns)
+        buckets = ET.SubElement(root, "Buckets")
+        for name in sorted(self.s3.buckets):
+            b = ET.SubElement(buckets, "Bucket")
+            ET.SubElement(b, "Name").text = name
+            ET.SubElement(b, "CreationDate").text = _isotime(0)
+        self.respond_xml(200, root)
+
+    def list_objects(self, bucket, query):
+        prefix = query.get("prefix", [""])[0]
+        delimiter = query.get("delimiter", [""])[0]
+        # continuation tokens are the last key of the previous page
+        start_after = max(
+            query.get("start-after", [""])[0], query.get("continuation-token", [""])[0]
+        )
+        max_keys = int(query.get("max-keys", ["1000"])[0])
+        keys, prefixes = self.s3.list_objects(bucket, prefix, delimiter, start_after)
+        truncated = len(keys) > max_keys
+        keys = keys[:max_keys]
+
+        root = ET.Element("ListBucketResult", xmlns=xmlns)
+        ET.SubElement(root, "Name").text = bucket
+        ET.SubElement(root, "Prefix").text = prefix
+        ET.SubElement(root, "Delimiter").text = delimiter
+        ET.SubElement(root, "KeyCount").text = str(len(keys) + len(prefixes))
+        ET.SubElement(root, "MaxKeys").text = str(max_keys)
+        ET.SubElement(root, "IsTruncated").text = "true" if truncated else "false"
+        if truncated:
+            ET.SubElement(root, "NextContinuationToken").text = keys[-1][0]
+
+        for key, (data, etag, mtime) in keys:
+            c = ET.SubElement(root, "Contents")
+            ET.SubElement(c, "Key").text = key
+            ET.SubElement(c, "LastModified").text = _isotime(mtime)
+            ET.SubElement(c, "ETag").text = etag
+            ET.SubElement(c, "Size").text = str(len(data))
+            ET.SubElement(c, "StorageClass").text = "STANDARD"
+
+        for p in prefixes:
+            ET.SubElement(ET.SubElement(root, "CommonPrefixes"), "Prefix").text = p
+
+        self.respond_xml(200, root)
+
+    def delete_objects(self, bucket, body):
+        keys = [el.text for el in ET.fromstring(body).iter() if el.tag.endswith("Key")]
+        for key in keys:
+            self.s3.delete_object(bucket, key)
+
+        root = ET.Element("DeleteResult", xmlns=xmlns)
+        for key in keys:
+            ET.SubElement(ET.SubElement(root, "Deleted"), "Key").text = key
+        self.respond_xml(200, root)
+
+
+class LocalS3:
+    def __init__(self, host="127.0.0.1", port=0, latency=0, bandwidth=None):
+        # latency in seconds per request, bandwidth in bytes/s per connection
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.buckets = {}
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.n_uploads = 0
+
+        self.server = ThreadingHTTPServer((host, port), S3Handler)
+        self.server.daemon_threads = True
+        self.server.s3 = self
+        self.thread = None
+
+    @property
+    def endpoint_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def throttle(self, n_bytes):
+        if self.bandwidth is not None:
+            time.sleep(n_bytes / self.bandwidth)
+
+    def create_bucket(self, bucket):
+        with self.lock:
+            self.buckets.setdefault(bucket, {})
+
+    def create_upload(self):
+        with self.lock:
+            self.n_uploads += 1
+            upload_id = f"upload-{self.n_uploads}"
+            self.uploads[upload_id] = {}
+        return upload_id
+
+    def put_object(self, bucket, key, data):
+        etag = _etag(data)
+        with self.lock:
+            self.buckets[bucket][key] = (data, etag, time.time())
+        return etag
+
+    def get_object(self, bucket, key):
+        with self.lock:
+            return self.buckets.get(bucket, {}).get(key)
+
+    def delete_object(self, bucket, key):
+        with self.lock:
+            self.buckets.get(bucket, {}).pop(key, None)
+
+    def list_objects(self, bucket, prefix="", delimiter="", start_after=""):
+        with self.lock:
+            items = sorted(self.buckets[bucket].items())
+
+        keys = []
+        prefixes = set()
+        for key, obj in items:
+            if not key.startswith(prefix) or key <= start_after:
+                continue
+            rest = key[len(prefix) :]
+            if delimiter != "" and delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter)[0] + delimiter)
+            else:
+                keys.append((key, obj))
+
+        return keys, sorted(prefixes)
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from fsspec.asyn import sync
+from os import path as op
+from src.transfer import fetch_range
+from threading import Lock
+
+# keys returned per ListObjectsV2 request
+page_size = 1000
+
+
+def split_pattern(rgx):
+    # "bucket/prefix/sub-*/anat/*.nii.gz" -> ("bucket", "prefix/")
+    rgx = rgx.removeprefix("s3://")
+    literal = re.split(r"[*?\[]", rgx, maxsplit=1)[0]
+    bucket, _, key = literal.partition("/")
+    if literal != rgx:
+        # list from the last complete directory before the first wildcard
+        key = key[: key.rfind("/") + 1]
+    return bucket, key
+
+
+def pattern_regex(rgx):
+    # glob semantics of fs.glob: * and ? stay within a path component
+    rgx = rgx.removeprefix("s3://")
+    out = []
+    i = 0
+    while i < len(rgx):
+        c = rgx[i]
+        if rgx.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and "]" in rgx[i + 1 :]:
+            end = rgx.index("]", i + 1)
+            out.append("[" + rgx[i + 1 : end].replace("!", "^", 1) + "]")
+            i = end
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return re.compile("".join(out) + "$")
+
+
+class StaleEntry(Exception):
+    # the object changed since it was listed
+    pass
+
+
+def precondition_failed(e):
+    # s3fs turns the 412 of a failed If-Match into a generic OSError
+    response = getattr(e.__cause__, "response", None) or {}
+    return response.get("Error", {}).get("Code") == "PreconditionFailed"
+
+
+async def _get_range(fs, fp, start, end, etag):
+    bucket, key, _ = fs.split_path(fp)
+    resp = await fs._call_s3(
+        "get_object",
+        Bucket=bucket,
+        Key=key,
+        Range=f"bytes={start}-{end - 1}",
+        IfMatch=f'"{etag}"',
+    )
+    try:
+        return await resp["Body"].read()
+    finally:
+        resp["Body"].close()
+
+
+class Manifest:
+    # Keys, sizes and ETags of the objects matching an input pattern, kept in
+    # a local index between runs. A run with an index only lists the keys
+    # sorting after the last indexed one, the others are trusted: reads are
+    # conditional on the indexed ETag, and an object changed or deleted since
+    # is looked up again or dropped. A full listing, e.g. to pick up keys
+    # inserted before the last one, is made on request or without an index.
+    # The first objects can be downloaded in the background while the
+    # pipeline starts.
+    def __init__(self, fs, rgx, index_dir, endpoint_url=None):
+        self.fs = fs
+        self.rgx = rgx.removeprefix("s3://")
+        self.bucket, self.prefix = split_pattern(rgx)
+        self.regex = pattern_regex(rgx)
+        self.lock = Lock()
+
+        name = hashlib.sha1(f"{endpoint_url}:{self.rgx}".encode()).hexdigest()[:16]
+        self.index = op.join(index_dir, f"manifest-{name}.json")
+        os.makedirs(index_dir, exist_ok=True)
+
+        self.entries = {}
+        self.known = {}
+        self.prefetched = {}
+        self.executor = None
+        self.dirty = False
+        self.stats = {
+            "list_requests": 0,
+            "listed": 0,
+            "changed": 0,
+            "prefetched": 0,
+            "invalidated": 0,
+        }
+
+    def __contains__(self, fp):
+        return fp in self.entries or fp in self.known
+
+    def load(self):
+        if not op.exists(self.index):
+            return False
+
+        with open(self.index) as f:
+            index = json.load(f)
+        if index.get("rgx") != self.rgx:
+            return False
+
+        self.entries = index["entries"]
+        return len(self.entries) > 0
+
+    def save(self):
+        with self.lock:
+            index = {"rgx": self.rgx, "entries": dict(self.entries)}
+            self.dirty = False
+
+        # replaced atomically, concurrent runs may share the index
+        tmp = f"{self.index}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp, self.index)
+
+    def list_keys(self, start_after=""):
+        kwargs = {"Bucket": self.bucket, "Prefix": self.prefix, "MaxKeys": page_size}
+        if start_after != "":
+            kwargs["StartAfter"] = start_after
+        listed = {}
+
+        while True:
+            response = self.fs.call_s3("list_objects_v2", **kwargs)
+            self.stats["list_requests"] += 1
+
+            for obj in response.get("Contents", []):
+                fp = f"{self.bucket}/{obj['Key']}"
+                if self.regex.match(fp):
+                    listed[fp] = {"size": obj["Size"], "etag": obj["ETag"].strip('"')}
+
+            if not response.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = response["NextContinuationToken"]
+
+        return listed
+
+    def refresh(self):
+        # new, overwritten and deleted keys, wherever they sort
+        listed = self.list_keys()
+        keys = listed.keys() | self.entries.keys()
+        changed = sum(1 for fp in keys if listed.get(fp) != self.entries.get(fp))
+
+        with self.lock:
+            self.entries = listed
+            self.dirty = self.dirty or changed > 0
+        self.stats["changed"] += changed
+
+    def update(self):
+        # only keys sorting after the last indexed one
+        last = max(self.entries).split("/", 1)[1]
+        listed = self.list_keys(start_after=last)
+        changed = sum(1 for fp in listed if listed[fp] != self.entries.get(fp))
+
+        with self.lock:
+            self.entries.update(listed)
+            self.dirty = self.dirty or changed > 0
+        self.stats["changed"] += changed
+
+    def open(self, refresh=False):
+        if self.load() is False or refresh is True:
+            self.refresh()
+        else:
+            self.update()
+
+        self.stats["listed"] = len(self.entries)
+        return self
+
+    def files(self, n_files=None):
+        return sorted(self.entries)[:n_files]
+
+    def size(self, fp):
+        entry = self.entries.get(fp) or self.known.get(fp)
+        return entry["size"] if entry is not None else None
+
+    def version(self, fp):
+        entry = self.entries.get(fp)
+        return entry["etag"] if entry is not None else None
+
+    def add(self, fp, size):
+        # objects written during the run, not persisted to the index
+        with self.lock:
+            self.known[fp] = {"size": size}
+
+    def stat(self, fp):
+        # current size and ETag of a listed object, dropped if it was deleted
+        try:
+            info = self.fs.info(fp, refresh=True)
+        except FileNotFoundError:
+            self.invalidate(fp)
+            raise
+
+        entry = {"size": info["size"], "etag": info["ETag"].strip('"')}
+        with self.lock:
+            if self.entries.get(fp) != entry:
+                self.stats["invalidated"] += 1
+                self.dirty = True
+            self.entries[fp] = entry
+        return entry
+
+    def invalidate(self, fp):
+        with self.lock:
+            self.known.pop(fp, None)
+            if self.entries.pop(fp, None) is None:
+                return
+            self.stats["invalidated"] += 1
+            self.dirty = True
+
+    def fetch_range(self, fs, fp, start, end):
+        # objects written during the run have no ETag and are read as is
+        etag = self.version(fp)
+        if etag is None:
+            return fetch_range(fs, fp, start, end)
+
+        try:
+            return sync(fs.loop, _get_range, fs, fp, start, end, etag)
+        except OSError as e:
+            if precondition_failed(e):
+                raise StaleEntry(fp) from e
+            if isinstance(e, FileNotFoundError):
+                self.invalidate(fp)
+            raise
+
+    def prefetch(self, files, workers=4):
+        if len(files) == 0:
+            return
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        for fp in files:
+            self.prefetched[fp] = self.executor.submit(
+                self.fetch_range, self.fs, fp, 0, self.entries[fp]["size"]
+            )
+
+    def take(self, fp):
+        # downloaded object if it was prefetched, each one is handed out once
+        with self.lock:
+            future = self.prefetched.pop(fp, None)
+        if future is None:
+            return None
+
+        try:
+            data = future.result()
+        except StaleEntry:
+            # read again once the entry is up to date
+            return None
+
+        self.stats["prefetched"] += 1
+        return data
+
+    def close(self):
+        if self.executor is not None:
+            for future in self.prefetched.values():
+                future.cancel()
+            self.executor.shutdown(wait=True)
+        self.prefetched = {}
+
+        # entries looked up again or dropped during the run
+        if self.dirty is True:
+            self.save()
+
+    def write_stats(self, out_dir, bench_name):
+        with open(op.join(out_dir, "manifest.csv"), "a+") as f:
+            f.write(
+                f"{bench_name},{self.stats['list_requests']},{self.stats['listed']},"
+                f"{self.stats['changed']},{self.stats['prefetched']},"
+                f"{self.stats['invalidated']}\n"
+            )
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+import mmap
+import os
+import numpy as np
+from src import nifti
+from src.transfer import part_size_default
+
+
+def read_header(mm, fp):
+    header = nifti.parse_header(mm)
+
+    slope, inter = header.get_slope_inter()
+    if slope is not None and (slope != 1 or inter != 0):
+        raise ValueError(f"{fp}: mmap mode does not support scaled data")
+
+    return header
+
+
+def release(mm, start, end):
+    # unmap processed pages from this process, they stay in the page cache
+    # (written back later for the output) so memory use does not grow
+    start -= start % mmap.PAGESIZE
+    if end > start:
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
+
+def increment_data(src, dst, header, chunk_size):
+    offset = int(header["vox_offset"])
+    dtype = header.get_data_dtype()
+    n_vox = int(np.prod(header.get_data_shape()))
+
+    # views over both mappings, released before the mappings are closed
+    data_in = np.frombuffer(src, dtype=dtype, count=n_vox, offset=offset)
+    data_out = np.frombuffer(dst, dtype=dtype, count=n_vox, offset=offset)
+
+    step = max(1, chunk_size // dtype.itemsize)
+    for first in range(0, n_vox, step):
+        last = min(first + step, n_vox)
+        nifti.saturating_add(data_in[first:last], out=data_out[first:last])
+
+        release(src, offset + first * dtype.itemsize, offset + last * dtype.itemsize)
+        release(dst, offset + first * dtype.itemsize, offset + last * dtype.itemsize)
+
+
+def increment(fp, out_fp, chunk_size=part_size_default):
+    with open(fp, "rb") as f_in, open(out_fp, "w+b") as f_out:
+        src = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            src.madvise(mmap.MADV_SEQUENTIAL)
+            header = read_header(src, fp)
+            offset = int(header["vox_offset"])
+            size = offset + int(np.prod(header.get_data_shape())) * header.get_data_dtype().itemsize
+
+            # blocks are allocated up front rather than on the first write to each page
+            os.posix_fallocate(f_out.fileno(), 0, size)
+            dst = mmap.mmap(f_out.fileno(), size, access=mmap.ACCESS_WRITE)
+            try:
+                dst.madvise(mmap.MADV_SEQUENTIAL)
+                # header, extensions and padding are copied as is
+                dst[:offset] = src[:offset]
+                increment_data(src, dst, header, chunk_size)
+            finally:
+                dst.close()
+        finally:
+            src.close()
+
+    return size
@@ -5,18 +5,35 @@ import numpy
 import hashlib
 import pathlib
 import nibabel as nib
-from src.helpers import setup_bench, benchmark, drop_caches
+from src import compressors, parallel_gzip
+from src.helpers import setup_bench, benchmark, drop_caches, merge_bench, record, record_bytes
 from os import path as op, utime, remove
+from time import perf_counter, perf_counter_ns
 
 
 @benchmark
 def compress(data, mtime, clevel=9, **kwargs):
-    return gzip.compress(data, mtime=mtime, compresslevel=clevel)
+    gz_data = gzip.compress(data, mtime=mtime, compresslevel=clevel)
+    record_bytes(len(data), len(gz_data))
+    return gz_data
+
+
+@benchmark
+def compress_parallel(
+    data, mtime, clevel=9, threads=1, block_size=parallel_gzip.block_size_default, **kwargs
+):
+    gz_data = parallel_gzip.compress(
+        data, clevel=clevel, threads=threads, block_size=block_size, mtime=mtime
+    )
+    record_bytes(len(data), len(gz_data))
+    return gz_data
 
 
 @benchmark
 def decompress(gz_data, **kwargs):
-    return gzip.decompress(gz_data)
+    data = gzip.decompress(gz_data)
+    record_bytes(len(gz_data), len(data))
+    return data
 
 
 def write_file(fp, data, mtime, clevel=9, bfile=None):
@@ -38,14 +55,77 @@ def read_file(fp, bfile=None):
     return data
 
 
+def measure_speedup(
+    data, mtime, clevel=9, threads=1, block_size=parallel_gzip.block_size_default, fp="", bfile=None
+):
+    # both runs are timed around the bare calls, without the benchmark
+    # wrapper, and recorded as a pair of rows: speedup is the runtime ratio
+    start = perf_counter_ns()
+    gz_data = gzip.compress(data, mtime=mtime, compresslevel=clevel)
+    end = perf_counter_ns()
+    metrics = {"bytes_in": len(data), "bytes_out": len(gz_data)}
+    record(f"compress_serial_l{clevel}", fp, start, end, bfile, metrics=metrics)
+    serial = end - start
+
+    start = perf_counter_ns()
+    gz_data = parallel_gzip.compress(
+        data, clevel=clevel, threads=threads, block_size=block_size, mtime=mtime
+    )
+    end = perf_counter_ns()
+    metrics = {"bytes_in": len(data), "bytes_out": len(gz_data)}
+    record(f"compress_parallel_l{clevel}_t{threads}", fp, start, end, bfile, metrics=metrics)
+    parallel = end - start
+
+    return serial * 10 ** -9, parallel * 10 ** -9
+
+
+def setup_sweep(file):
+    with open(file, "w+") as f:
+        f.write(
+            "codec,level,repetition,size,compressed_size,ratio,compress_mbps,decompress_mbps\n"
+        )
+
+
+def measure_codec(data, codec, clevel, threads=1):
+    start = perf_counter()
+    c_data = codec.compress(data, clevel=clevel, threads=threads)
+    c_time = perf_counter() - start
+
+    start = perf_counter()
+    codec.decompress(c_data)
+    d_time = perf_counter() - start
+
+    # guard against the "none" codec being faster than the timer resolution
+    mb = len(data) / 1024 ** 2
+    return len(c_data), mb / max(c_time, 1e-9), mb / max(d_time, 1e-9)
+
+
+def sweep(data, codec_names, bfile, rep=0, threads=1):
+    with open(bfile, "a+") as f:
+        for name in codec_names:
+            codec = compressors.codecs[name]
+
+            for clevel in codec.levels:
+                c_size, c_mbps, d_mbps = measure_codec(data, codec, clevel, threads)
+                f.write(
+                    f"{name},{clevel},{rep},{len(data)},{c_size},"
+                    f"{len(data) / c_size},{c_mbps},{d_mbps}\n"
+                )
+                print(
+                    f"{name} level {clevel}: ratio {len(data) / c_size:.2f}, "
+                    f"compress {c_mbps:.1f}MB/s, decompress {d_mbps:.1f}MB/s"
+                )
+
+
 @click.command()
 @click.argument("filename", type=str)
 @click.option("--repetitions", type=int, default=5, help="Number of repetitions")
 @click.option(
     "--compression_level",
-    type=click.Choice(range(0, 10)),
-    default=6,
-    help="Compression level (as per gzip documentation)",
+    type=click.IntRange(0, 9),
+    multiple=True,
+    default=[6],
+    help="Compression level (as per gzip documentation). Can be repeated",
 )
 @click.option(
     "--benchmark_file",
@@ -53,24 +133,72 @@ def read_file(fp, bfile=None):
     default="gzip-benchmarks.csv",
     help="Filename where to store benchmarks to",
 )
-def main(filename, repetitions, benchmark_file, compression_level):
+@click.option(
+    "--threads",
+    type=int,
+    default=1,
+    help="Number of compression threads. Speedup is reported against 1 thread",
+)
+@click.option(
+    "--sweep",
+    "sweep_codecs",
+    is_flag=True,
+    help="Measure ratio and throughput of every codec and level instead",
+)
+@click.option(
+    "--codec",
+    type=click.Choice(list(compressors.codecs)),
+    multiple=True,
+    default=list(compressors.codecs),
+    help="Codecs to include in the sweep. Can be repeated",
+)
+def main(
+    filename, repetitions, benchmark_file, compression_level, threads, sweep_codecs, codec
+):
 
-    setup_bench(benchmark_file)
+    if sweep_codecs is True:
+        setup_sweep(benchmark_file)
+    else:
+        setup_bench(benchmark_file)
 
     # to consistently reproduce compression hash
     mtime = pathlib.Path(filename).stat().st_mtime
 
     for i in range(repetitions):
         drop_caches()
-        data = read_file(filename, bfile=benchmark_file)
-        gz_fn = write_file(
-            filename, data, bfile=benchmark_file, mtime=mtime, clevel=compression_level
-        )
 
-        print("Compressed output file: ", gz_fn)
+        if sweep_codecs is True:
+            data = read_file(filename)
+            sweep(data, codec, benchmark_file, rep=i, threads=threads)
+            continue
+
+        data = read_file(filename, bfile=benchmark_file)
 
-        # Cleanup
-        remove(gz_fn)
+        for clevel in compression_level:
+            gz_fn = write_file(
+                filename, data, bfile=benchmark_file, mtime=mtime, clevel=clevel
+            )
+
+            print("Compressed output file: ", gz_fn)
+
+            # Cleanup
+            remove(gz_fn)
+
+            if threads > 1:
+                serial, parallel = measure_speedup(
+                    data,
+                    mtime,
+                    clevel=clevel,
+                    threads=threads,
+                    fp=filename,
+                    bfile=benchmark_file,
+                )
+                print(
+                    f"Compression level {clevel}: serial {serial:.3f}s, "
+                    f"{threads} threads {parallel:.3f}s, speedup {serial / parallel:.2f}x"
+                )
+
+    merge_bench(benchmark_file)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+import numpy as np
+import nibabel as nib
+from io import BytesIO
+from src.transfer import BufferReader
+
+header_size = 348
+
+
+def parse_header(buf):
+    hdr = bytes(memoryview(buf).cast("B")[:header_size])
+
+    # sizeof_hdr is always 348, read in the byte order of the file
+    if int.from_bytes(hdr[:4], "little") == header_size:
+        endianness = "<"
+    elif int.from_bytes(hdr[:4], "big") == header_size:
+        endianness = ">"
+    else:
+        raise ValueError("Buffer does not start with a NIfTI-1 header")
+
+    return nib.Nifti1Header(binaryblock=hdr, endianness=endianness)
+
+
+def data_from_buffer(buf, header):
+    shape = header.get_data_shape()
+    offset = int(header["vox_offset"])
+
+    # view over the buffer, writable if the buffer is
+    data = np.frombuffer(
+        memoryview(buf).cast("B"),
+        dtype=header.get_data_dtype(),
+        count=int(np.prod(shape)),
+        offset=offset,
+    ).reshape(shape, order="F")
+
+    slope, inter = header.get_slope_inter()
+    if slope is not None and (slope != 1 or inter != 0):
+        data = data * slope + inter
+
+    return data
+
+
+def image_from_buffer(buf):
+    header = parse_header(buf)
+    data = data_from_buffer(buf, header)
+    return nib.Nifti1Image(data, header.get_best_affine(), header)
+
+
+def from_buffer(buf):
+    # avoid the copy BytesIO makes of mutable buffers
+    fh = nib.FileHolder(fileobj=BufferReader(buf))
+    return nib.Nifti1Image.from_file_map({"header": fh, "image": fh})
+
+
+def to_buffer(im):
+    bio = BytesIO()
+    file_map = im.make_file_map({"image": bio, "header": bio})
+    im.to_file_map(file_map)
+    return bio.getvalue()
+
+
+def saturating_add(data, value=1, out=None):
+    # integers stop at the largest value of their dtype instead of wrapping
+    if np.issubdtype(data.dtype, np.integer):
+        data = np.minimum(data, np.iinfo(data.dtype).max - value, out=out)
+        out = data
+    return np.add(data, value, out=out, dtype=data.dtype.type)
+
+
+def increment(im, inplace=False):
+    data = np.asanyarray(im.dataobj)
+
+    # buffers returned by reads3 may be read-only
+    if inplace is True and data.flags.writeable:
+        data = saturating_add(data, out=data)
+    else:
+        data = saturating_add(data)
+
+    return nib.Nifti1Image(data, im.affine, im.header)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+import os
+import sys
+import click
+import numpy as np
+import nibabel as nib
+import subprocess as sp
+from os import makedirs, path as op
+from src import compressors, nifti
+from src.locals3 import LocalS3
+
+repo_root = op.dirname(op.dirname(op.abspath(__file__)))
+
+# the local stand-in accepts any credentials, but botocore requires some
+dummy_credentials = {"AWS_ACCESS_KEY_ID": "offline", "AWS_SECRET_ACCESS_KEY": "offline"}
+
+
+def parse_size(size):
+    return tuple(int(d) for d in size.split("x"))
+
+
+def seed(s3, bucket, sizes, n_files, suffix=".nii", dtype=np.uint16, rng_seed=0):
+    rng = np.random.default_rng(rng_seed)
+    codec = compressors.codec_for(suffix)
+    s3.create_bucket(bucket)
+
+    keys = []
+    for size in sizes:
+        for i in range(n_files):
+            data = rng.integers(0, 100, size=parse_size(size), dtype=dtype)
+            raw = nifti.to_buffer(nib.Nifti1Image(data, np.eye(4)))
+
+            key = f"sub-{i:02d}_{size}_T1w{suffix}"
+            s3.put_object(bucket, key, codec.compress(raw))
+            keys.append(f"{bucket}/{key}")
+
+    return keys
+
+
+def run_inc(endpoint_url, input_rgx, output_bucket, bench_file, n_files, inc_args=()):
+    exp = [
+        sys.executable,
+        "-m",
+        "src.inc",
+        input_rgx,
+        output_bucket,
+        "--n_files",
+        str(n_files),
+        "--bench_file",
+        bench_file,
+        "--endpoint_url",
+        endpoint_url,
+        *inc_args,
+    ]
+
+    print("Launching command: ", " ".join(exp))
+    out = sp.run(
+        args=exp, capture_output=True, cwd=repo_root, env={**os.environ, **dummy_credentials}
+    )
+
+    print("STDOUT: ", out.stdout.decode("utf-8"))
+    print("STDERR: ", out.stderr.decode("utf-8"))
+    return out.returncode
+
+
+@click.command(context_settings={"ignore_unknown_options": True})
+@click.argument("results_fldr", type=str)
+@click.argument("inc_args", nargs=-1, type=click.UNPROCESSED)
+@click.option(
+    "--size",
+    "sizes",
+    type=str,
+    multiple=True,
+    default=["128x128x128"],
+    help="Shape of the synthetic volumes, e.g. 256x256x128. Can be repeated",
+)
+@click.option("--n_files", type=int, default=1, help="Number of volumes per size")
+@click.option("--suffix", type=str, default=".nii", help="Suffix selecting the codec")
+@click.option("--latency", type=float, default=0, help="Injected latency per request in ms")
+@click.option(
+    "--bandwidth", type=float, default=None, help="Bandwidth limit per connection in MB/s"
+)
+@click.option("--repetitions", type=int, default=1, help="number of repetitions to run")
+@click.option("--name", type=str, default="offline", help="Name of the benchmark files")
+def main(
+    results_fldr, inc_args, sizes, n_files, suffix, latency, bandwidth, repetitions, name
+):
+    """Run src/inc.py against a local S3 stand-in.
+
+    Arguments after RESULTS_FLDR are passed to src/inc.py, e.g.
+    python -m src.offline_bench results/offline --it 5 --parallel_parts 4
+    """
+    if bandwidth is not None:
+        bandwidth = bandwidth * 1024 ** 2
+
+    with LocalS3(latency=latency / 1000, bandwidth=bandwidth) as s3:
+        keys = seed(s3, "inputs", sizes, n_files, suffix=suffix)
+        print(f"Local S3 listening on {s3.endpoint_url} with {len(keys)} inputs")
+
+        for r in range(repetitions):
+            rep_fldr = op.join(results_fldr, f"rep-{r}")
+            makedirs(rep_fldr, exist_ok=True)
+
+            s3.create_bucket("outputs")
+            returncode = run_inc(
+                s3.endpoint_url,
+                "inputs/*",
+                "outputs",
+                op.join(rep_fldr, f"benchmark_{name}.csv"),
+                len(keys),
+                inc_args,
+            )
+
+            # start every repetition from an empty output bucket
+            s3.buckets.pop("outputs")
+
+            if returncode != 0:
+                sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
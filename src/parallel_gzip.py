@@ -0,0 +1,24 @@
+#!/usr/bin/env python
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+
+# amount of uncompressed data deflated by each worker at a time
+block_size_default = 4 * 1024 ** 2
+
+
+def blocks(data, block_size=block_size_default):
+    view = memoryview(data).cast("B")
+    return [view[i : i + block_size] for i in range(0, len(view), block_size)]
+
+
+def compress(data, clevel=9, threads=1, block_size=block_size_default, mtime=None):
+    if threads <= 1 or len(data) <= block_size:
+        return gzip.compress(data, compresslevel=clevel, mtime=mtime)
+
+    def _deflate(block):
+        return gzip.compress(block, compresslevel=clevel, mtime=mtime)
+
+    # zlib releases the GIL, so blocks are deflated concurrently. Each block
+    # becomes a gzip member and concatenated members form a valid gzip stream
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        return b"".join(executor.map(_deflate, blocks(data, block_size)))
@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+import io
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from src.transfer import fetch_range
+
+min_block_size = 1024 ** 2
+max_block_size = 256 * 1024 ** 2
+
+
+class PrefetchFile(io.RawIOBase):
+    # Read-only s3 file that detects sequential access and keeps up to
+    # max_inflight blocks downloading ahead of the reader. The block size
+    # doubles whenever the reader has to wait for a block, and otherwise
+    # tracks the amount read while one block downloads. Non-sequential reads
+    # are fetched directly and reset the readahead.
+    def __init__(
+        self,
+        fs,
+        fp,
+        max_inflight=4,
+        block_size=4 * 1024 ** 2,
+        size=None,
+        fetch=fetch_range,
+        min_sequential=2,
+    ):
+        self.fs = fs
+        self.fp = fp
+        self.size = fs.info(fp)["size"] if size is None else size
+        self.max_inflight = max_inflight
+        self.block_size = min(max(block_size, min_block_size), max_block_size)
+        self.fetch = fetch
+        self.min_sequential = min_sequential
+
+        self.pos = 0
+        self.last_end = None
+        # the first read, wherever it starts, counts as sequential
+        self.streak = min_sequential - 1
+        self.blocks = deque()
+        self.next_start = None
+        self.executor = ThreadPoolExecutor(max_workers=max_inflight)
+
+        # exponentially weighted rates in bytes/s and fetch time in s
+        self.fetch_time = None
+        self.consume_rate = None
+        self.last_read = None
+        self.stats = {"requests": 0, "bytes": 0, "stalls": 0, "resets": 0}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += self.size
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+    def close(self):
+        if not self.closed:
+            self._drop()
+            self.executor.shutdown(cancel_futures=True)
+        super().close()
+
+    def _timed_fetch(self, start, end):
+        t = perf_counter()
+        data = self.fetch(self.fs, self.fp, start, end)
+        t = perf_counter() - t
+
+        if self.fetch_time is not None:
+            t = 0.8 * self.fetch_time + 0.2 * t
+        self.fetch_time = t
+        return data
+
+    def _drop(self):
+        for _, _, future in self.blocks:
+            future.cancel()
+        self.blocks.clear()
+        self.next_start = None
+
+    def _schedule(self, until):
+        # keep blocks downloading up to max_inflight blocks past `until`
+        if self.next_start is None:
+            self.next_start = self.pos
+
+        while self.next_start < self.size and (
+            self.next_start < until or len(self.blocks) < self.max_inflight
+        ):
+            start = self.next_start
+            end = min(start + self.block_size, self.size)
+            future = self.executor.submit(self._timed_fetch, start, end)
+            self.blocks.append((start, end, future))
+            self.next_start = end
+            self.stats["requests"] += 1
+            self.stats["bytes"] += end - start
+
+    def _adapt(self, stalled):
+        if stalled:
+            # the reader is faster than the downloads, amortise request latency
+            block_size = 2 * self.block_size
+        elif self.consume_rate is not None and self.fetch_time is not None:
+            # enough data for the reader to consume while a block downloads
+            block_size = int(self.consume_rate * self.fetch_time)
+            block_size = min(max(block_size, self.block_size // 2), self.block_size)
+        else:
+            return
+
+        self.block_size = min(max(block_size, min_block_size), max_block_size)
+
+    def readinto(self, b):
+        view = memoryview(b).cast("B")
+        n = max(0, min(len(view), self.size - self.pos))
+        if n == 0:
+            return 0
+
+        held = len(self.blocks) > 0 and self.blocks[0][0] <= self.pos < self.next_start
+        if self.last_end in (None, self.pos) or held:
+            self.streak += 1
+        else:
+            self.streak = 0
+            self.stats["resets"] += 1
+
+        # forget blocks behind the reader, or all of them after a jump
+        while len(self.blocks) > 0 and self.blocks[0][1] <= self.pos:
+            self.blocks.popleft()
+        if len(self.blocks) > 0 and self.blocks[0][0] > self.pos:
+            self._drop()
+
+        if self.streak < self.min_sequential:
+            self._drop()
+            view[:n] = self.fetch(self.fs, self.fp, self.pos, self.pos + n)
+            self.stats["requests"] += 1
+            self.stats["bytes"] += n
+
+        else:
+            self._schedule(self.pos + n)
+            waited = 0
+            filled = 0
+
+            while filled < n:
+                start, end, future = self.blocks[0]
+                stalled = not future.done()
+
+                t = perf_counter()
+                data = future.result()
+                waited += perf_counter() - t
+                self._adapt(stalled)
+                self.stats["stalls"] += stalled
+
+                offset = self.pos + filled - start
+                k = min(end - start - offset, n - filled)
+                view[filled : filled + k] = data[offset : offset + k]
+                filled += k
+
+                if offset + k == end - start:
+                    self.blocks.popleft()
+                    self._schedule(self.pos + n)
+
+            # rate at which the reader consumes data, excluding the waits
+            now = perf_counter()
+            if self.last_read is not None:
+                rate = n / max(now - self.last_read - waited, 1e-6)
+                if self.consume_rate is not None:
+                    rate = 0.8 * self.consume_rate + 0.2 * rate
+                self.consume_rate = rate
+            self.last_read = now
+
+        self.pos += n
+        self.last_end = self.pos
+        return n
+
+    def readall(self):
+        # single preallocated buffer rather than io's default small reads
+        buf = bytearray(max(0, self.size - self.pos))
+        n = self.readinto(buf)
+        del buf[n:]
+        return buf
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+import io
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore
+
+# default size of a single ranged request
+part_size_default = 8 * 1024 ** 2
+
+
+def part_ranges(size, part_size):
+    return [(start, min(start + part_size, size)) for start in range(0, size, part_size)]
+
+
+def fetch_range(fs, fp, start, end):
+    return fs.cat_file(fp, start=start, end=end)
+
+
+def read_ranges(
+    fs, fp, parallel_parts, part_size=part_size_default, size=None, fetch=fetch_range
+):
+    if size is None:
+        size = fs.info(fp)["size"]
+
+    # preallocate output buffer, parts are copied in place as they arrive
+    buf = bytearray(size)
+    view = memoryview(buf)
+
+    def _fetch(r):
+        start, end = r
+        view[start:end] = fetch(fs, fp, start, end)
+
+    with ThreadPoolExecutor(max_workers=parallel_parts) as executor:
+        # list() to propagate exceptions raised by the workers
+        list(executor.map(_fetch, part_ranges(size, part_size)))
+
+    return buf
+
+
+def gzip_isize(fs, fp, size, fetch=fetch_range):
+    # uncompressed size (mod 2**32) stored in the last 4 bytes of the gzip trailer
+    return int.from_bytes(fetch(fs, fp, size - 4, size), "little")
+
+
+class Inflater:
+    def __init__(self, size_hint):
+        self.buf = bytearray(size_hint)
+        self.offset = 0
+        self.d = zlib.decompressobj(wbits=31)
+
+    def feed(self, chunk):
+        while len(chunk) > 0:
+            # concatenated gzip members are decoded one after the other
+            if self.d.eof:
+                self.d = zlib.decompressobj(wbits=31)
+
+            piece = self.d.decompress(chunk)
+            end = self.offset + len(piece)
+
+            # ISIZE only describes the last member and wraps above 4GiB
+            if end > len(self.buf):
+                self.buf.extend(bytes(end - len(self.buf)))
+
+            self.buf[self.offset : end] = piece
+            self.offset = end
+            chunk = self.d.unused_data if self.d.eof else b""
+
+    def result(self):
+        if not self.d.eof:
+            raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+        if self.offset < len(self.buf):
+            del self.buf[self.offset :]
+        return self.buf
+
+
+def read_gzip_stream(
+    fs, fp, parallel_parts, part_size=part_size_default, size=None, fetch=fetch_range
+):
+    if size is None:
+        size = fs.info(fp)["size"]
+
+    inflater = Inflater(gzip_isize(fs, fp, size, fetch=fetch))
+    ranges = iter(part_ranges(size, part_size))
+    inflight = deque()
+
+    with ThreadPoolExecutor(max_workers=parallel_parts) as executor:
+
+        def _submit():
+            r = next(ranges, None)
+            if r is not None:
+                inflight.append(executor.submit(fetch, fs, fp, *r))
+
+        for _ in range(parallel_parts):
+            _submit()
+
+        # decompress parts in order while the following ones are downloading
+        while len(inflight) > 0:
+            chunk = inflight.popleft().result()
+            _submit()
+            inflater.feed(chunk)
+
+    return inflater.result()
+
+
+class BufferReader(io.RawIOBase):
+    # read-only file object over an existing buffer, without copying it
+    def __init__(self, buf):
+        self.view = memoryview(buf).cast("B")
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self.view) - self.pos))
+        b[:n] = self.view[self.pos : self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.pos
+        elif whence == io.SEEK_END:
+            offset += len(self.view)
+        self.pos = offset
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+
+class MultipartWriter:
+    # S3 rejects non-final parts smaller than 5MiB
+    min_part_size = 5 * 1024 ** 2
+
+    def __init__(self, fs, fp, parallel_parts, part_size=part_size_default):
+        self.fs = fs
+        self.fp = fp
+        self.bucket, self.key, _ = fs.split_path(fp)
+        self.part_size = max(part_size, self.min_part_size)
+        self.upload_id = None
+        self.parts = []
+        self.buffer = bytearray()
+        self.executor = ThreadPoolExecutor(max_workers=parallel_parts)
+        # bound the number of parts held in memory while waiting to be sent
+        self.inflight = BoundedSemaphore(2 * parallel_parts)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data):
+        view = memoryview(data).cast("B")
+        n_bytes = len(view)
+
+        # top up a partially filled part first
+        if len(self.buffer) > 0:
+            fill = self.part_size - len(self.buffer)
+            self.buffer += view[:fill]
+            view = view[fill:]
+
+            if len(self.buffer) < self.part_size:
+                return n_bytes
+
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+
+        while len(view) >= self.part_size:
+            self._submit(bytes(view[: self.part_size]))
+            view = view[self.part_size :]
+
+        self.buffer += view
+        return n_bytes
+
+    def _submit(self, data):
+        if self.upload_id is None:
+            mpu = self.fs.call_s3(
+                "create_multipart_upload", Bucket=self.bucket, Key=self.key
+            )
+            self.upload_id = mpu["UploadId"]
+
+        self.inflight.acquire()
+        future = self.executor.submit(self._upload_part, len(self.parts) + 1, data)
+        future.add_done_callback(lambda f: self.inflight.release())
+        self.parts.append(future)
+
+    def _upload_part(self, part_number, data):
+        out = self.fs.call_s3(
+            "upload_part",
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=data,
+        )
+        return {"ETag": out["ETag"], "PartNumber": part_number}
+
+    def close(self):
+        try:
+            if self.upload_id is None:
+                # object fits in a single part, no need for a multipart upload
+                self.fs.pipe_file(self.fp, bytes(self.buffer))
+            else:
+                if len(self.buffer) > 0:
+                    self._submit(bytes(self.buffer))
+                parts = [f.result() for f in self.parts]
+                self.fs.call_s3(
+                    "complete_multipart_upload",
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self.upload_id,
+                    MultipartUpload={"Parts": parts},
+                )
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self.buffer = bytearray()
+            self.executor.shutdown()
+            self.fs.invalidate_cache(self.fp)
+
+    def abort(self):
+        self.executor.shutdown(cancel_futures=True)
+        if self.upload_id is not None:
+            self.fs.call_s3(
+                "abort_multipart_upload",
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self.upload_id,
+            )
+            self.upload_id = None
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+import io
+import numpy as np
+from collections import namedtuple
+from nibabel.streamlines.trk import Field, TrkFile, get_affine_trackvis_to_rasmm
+from src.readahead import PrefetchFile
+
+header_size = TrkFile.HEADER_SIZE
+
+# points (in RAS+ mm) and scalars of every streamline in a batch, split at
+# offsets, and one row of properties per streamline. points and scalars are
+# overwritten by the next batch.
+Batch = namedtuple("Batch", ["points", "scalars", "properties", "offsets"])
+
+
+def read_header(fs, fp):
+    buf = fs.cat_file(fp, start=0, end=header_size)
+    return TrkFile._read_header(io.BytesIO(buf))
+
+
+def record_bounds(words, n_scalars, n_properties, pos=0):
+    # streamline records are variable length: an int32 point count, then the
+    # points and their scalars, then the properties, all 4 byte words
+    counts = words.view(words.dtype.byteorder + "i4")
+    point_words = 3 + n_scalars
+    starts = []
+    n_points = []
+
+    while pos < len(words):
+        n = int(counts[pos])
+        end = pos + 1 + n * point_words + n_properties
+        if end > len(words):
+            break
+        starts.append(pos)
+        n_points.append(n)
+        pos = end
+
+    return np.array(starts, dtype=np.int64), np.array(n_points, dtype=np.int64), pos
+
+
+class StreamlineDecoder:
+    # Decodes whole records from a word buffer into arrays allocated once for
+    # max_points points, reused by every batch.
+    def __init__(self, header, max_points):
+        self.n_scalars = int(header[Field.NB_SCALARS_PER_POINT])
+        self.n_properties = int(header[Field.NB_PROPERTIES_PER_STREAMLINE])
+        self.dtype = np.dtype(header[Field.ENDIANNESS] + "f4")
+
+        affine = get_affine_trackvis_to_rasmm(header).astype(np.float32)
+        self.linear = np.ascontiguousarray(affine[:3, :3].T)
+        self.translation = affine[:3, 3]
+
+        self.max_points = max_points
+        self.point_buf = np.empty((max_points, 3 + self.n_scalars), dtype=np.float32)
+        self.points = np.empty((max_points, 3), dtype=np.float32)
+        self.index = np.empty(max_points * (3 + self.n_scalars), dtype=np.int64)
+
+    def decode(self, words, starts, n_points):
+        point_words = n_points * (3 + self.n_scalars)
+        total = int(point_words.sum())
+        index = self.index[:total]
+
+        # word index of every point coordinate and scalar, in record order
+        shift = starts + 1 - (np.cumsum(point_words) - point_words)
+        record_first = np.repeat(shift, point_words)
+        np.add(record_first, np.arange(total), out=index)
+
+        point_buf = self.point_buf[: total // (3 + self.n_scalars)]
+        np.take(words, index, out=point_buf.reshape(-1))
+
+        points = self.points[: len(point_buf)]
+        np.matmul(point_buf[:, :3], self.linear, out=points)
+        points += self.translation
+
+        prop_first = starts + 1 + point_words
+        properties = words[prop_first[:, None] + np.arange(self.n_properties)]
+
+        offsets = np.zeros(len(n_points) + 1, dtype=np.int64)
+        np.cumsum(n_points, out=offsets[1:])
+
+        return Batch(points, point_buf[:, 3:], properties.astype(np.float32), offsets)
+
+    def split(self, starts, n_points):
+        # largest groups of records fitting in the preallocated arrays
+        groups = []
+        first = 0
+        cum = np.cumsum(n_points)
+        while first < len(starts):
+            base = cum[first - 1] if first > 0 else 0
+            last = int(np.searchsorted(cum, base + self.max_points, side="right"))
+            last = max(last, first + 1)
+            groups.append((first, last))
+            first = last
+        return groups
+
+
+def iter_batches(
+    fs,
+    fp,
+    header=None,
+    chunk_size=64 * 1024 ** 2,
+    max_points=2 ** 20,
+    max_inflight=4,
+):
+    if header is None:
+        header = read_header(fs, fp)
+    decoder = StreamlineDecoder(header, max_points)
+
+    with PrefetchFile(fs, fp, max_inflight=max_inflight, block_size=chunk_size) as f:
+        f.seek(header_size)
+        # partial record carried over to the next chunk
+        buf = bytearray()
+
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+
+            buf += chunk
+            usable = len(buf) - len(buf) % 4
+            words = np.frombuffer(buf, dtype=decoder.dtype, count=usable // 4)
+            starts, n_points, consumed = record_bounds(
+                words, decoder.n_scalars, decoder.n_properties
+            )
+            if not decoder.dtype.isnative:
+                words = words.astype(np.float32)
+
+            for first, last in decoder.split(starts, n_points):
+                if n_points[first:last].sum() > decoder.max_points:
+                    # a single streamline larger than the buffers
+                    decoder = StreamlineDecoder(header, int(n_points[first:last].sum()))
+                yield decoder.decode(words, starts[first:last], n_points[first:last])
+
+            del words
+            del buf[: consumed * 4]
+
+        if len(buf) > 0:
+            raise ValueError(f"{fp}: truncated streamline record at the end of the file")
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+from time import perf_counter_ns
+
+# imports are timed so they can be reported separately from the experiments
+import_start = perf_counter_ns()
+
+import gc
+import io
+import json
+import os
+import socket
+import time
+import traceback
+import click
+import s3fs
+import socketserver
+from contextlib import redirect_stderr, redirect_stdout
+from src import clients, helpers, inc
+
+import_end = perf_counter_ns()
+
+
+def startup_ns():
+    # time since the process was created, from its start time in /proc
+    with open("/proc/self/stat") as f:
+        start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+    started = start_ticks / os.sysconf("SC_CLK_TCK")
+    elapsed = time.clock_gettime(time.CLOCK_BOOTTIME) - started
+    # minus the time spent since the imports completed
+    return int(elapsed * 10 ** 9) - (perf_counter_ns() - import_end)
+
+
+def reset_state():
+    # no client, connection pool or listing is carried over between jobs
+    clients.reset()
+    s3fs.S3FileSystem.clear_instance_cache()
+    helpers.recorder.flush()
+    gc.collect()
+    # the peak recorded by each job is its own
+    helpers.reset_peak_rss()
+
+
+def bench_file(argv):
+    if "--bench_file" in argv:
+        return argv[argv.index("--bench_file") + 1]
+    return None
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    # one json request per line: {"argv": [...]} runs src/inc.py with argv,
+    # {"cmd": "shutdown"} stops the worker
+    def handle(self):
+        for line in self.rfile:
+            request = json.loads(line)
+
+            if request.get("cmd") == "shutdown":
+                self.reply({"returncode": 0})
+                self.server.running = False
+                return
+
+            self.reply(self.server.run(request["argv"]))
+
+    def reply(self, response):
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+
+class Worker(socketserver.UnixStreamServer):
+    # Resident process that imports the benchmark dependencies once and runs
+    # the experiments it receives one at a time.
+    def __init__(self, socket_path, startup):
+        self.socket_path = socket_path
+        self.startup = startup
+        self.running = True
+        self.jobs = 0
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        super().__init__(socket_path, JobHandler)
+
+    def run(self, argv):
+        start = perf_counter_ns()
+        reset_state()
+        end = perf_counter_ns()
+
+        out = io.StringIO()
+        returncode = 0
+        with redirect_stdout(out), redirect_stderr(out):
+            try:
+                inc.main.main(args=argv, prog_name="inc", standalone_mode=False)
+            except click.exceptions.Exit as e:
+                returncode = e.exit_code
+            except click.ClickException as e:
+                e.show()
+                returncode = e.exit_code
+            except Exception:
+                traceback.print_exc()
+                returncode = 1
+
+        # interpreter start and imports are only paid by the first job
+        bfile = bench_file(argv)
+        if self.jobs == 0:
+            helpers.record("worker_startup", "", import_end - self.startup, import_end, bfile)
+            helpers.record("worker_imports", "", import_start, import_end, bfile)
+        helpers.record("worker_reset", "", start, end, bfile)
+        helpers.merge_bench(bfile)
+
+        self.jobs += 1
+        return {"returncode": returncode, "output": out.getvalue()}
+
+    def serve(self):
+        while self.running:
+            self.handle_request()
+        self.server_close()
+        os.remove(self.socket_path)
+
+
+def submit(socket_path, request, timeout=None):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        s.settimeout(timeout)
+        s.connect(socket_path)
+        s.sendall(json.dumps(request).encode("utf-8") + b"\n")
+
+        with s.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+def wait_ready(socket_path, timeout=60):
+    deadline = time.time() + timeout
+    while not os.path.exists(socket_path):
+        if time.time() > deadline:
+            raise TimeoutError(f"worker did not start listening on {socket_path}")
+        time.sleep(0.05)
+
+
+@click.command()
+@click.argument("socket_path", type=str)
+def main(socket_path):
+    worker = Worker(socket_path, startup_ns())
+    print(f"Worker listening on {socket_path}", flush=True)
+    worker.serve()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+import tempfile
+import numpy as np
+from os import makedirs, path as op
+from ..src import aggregate, helpers
+
+
+class TestAggregate:
+    @classmethod
+    def setup_class(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.durations = {}
+
+        for rep in range(3):
+            rep_fldr = op.join(cls.root, "instance", "conditions-test", f"rep-{rep}")
+            makedirs(rep_fldr)
+            bfile = op.join(rep_fldr, "benchmark_1i_2f.csv")
+            helpers.setup_bench(bfile)
+
+            for i in range(2):
+                start = 10 ** 9 * (rep + i)
+                end = start + 10 ** 8 * (rep + 1)
+                helpers.record("read", f"bucket/f{i}.nii", start, end, bfile, tid=1)
+                cls.durations.setdefault("read", []).append((end - start) * 10 ** -9)
+            # an unfinished call, without its end row
+            helpers.recorder.add(bfile, f"write_start,bucket/f0.nii,{10 ** 10},1,,1,,,,\n")
+            helpers.merge_bench(bfile)
+
+            with open(op.join(rep_fldr, "makespan.csv"), "a+") as f:
+                f.write(f"benchmark_1i_2f.csv,0,{10 ** 9},{1.0 + rep}\n")
+
+    def test_scan(self):
+        stages, runs = aggregate.scan(self.root, workers=1)
+
+        assert len(stages) == 6
+        assert set(stages["stage"]) == {"read"}
+        assert set(stages["rep"]) == {0, 1, 2}
+        assert stages["instance"][0] == "instance"
+        assert np.allclose(stages["duration"], (stages["end"] - stages["start"]) * 10 ** -9)
+        assert sorted(runs["duration"]) == [1.0, 2.0, 3.0]
+
+    def test_dataset(self):
+        stages, runs = aggregate.scan(self.root, workers=1)
+        out_dir = tempfile.mkdtemp()
+        aggregate.write_dataset(out_dir, "stages", stages)
+
+        loaded = aggregate.load_dataset(out_dir, "stages")
+        fields = ["rep", "start", "end", "file", "duration"]
+        assert np.array_equal(np.sort(loaded[fields]), np.sort(stages[fields]))
+
+    def test_summarise(self):
+        stages, _ = aggregate.scan(self.root, workers=1)
+        summary = aggregate.summarise(stages)
+        expected = np.array(self.durations["read"])
+
+        assert summary["n"][0] == 6
+        assert np.isclose(summary["mean"][0], expected.mean())
+        assert np.isclose(summary["std"][0], expected.std(ddof=1))
+        for q in aggregate.percentiles:
+            assert np.isclose(summary[f"p{q}"][0], np.percentile(expected, q))
+        assert summary["median_ci_low"][0] <= summary["p50"][0] <= summary["median_ci_high"][0]
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+import numpy as np
+import nibabel as nib
+from ..src import batch, nifti
+
+
+class TestBatch:
+    @classmethod
+    def setup_class(cls):
+        rng = np.random.default_rng(0)
+        cls.volumes = [
+            rng.integers(0, 100, size=(4, 5, 6), dtype=np.uint16),
+            rng.integers(0, 100, size=(4, 5, 6), dtype=np.uint16),
+            rng.integers(0, 100, size=(3, 3, 3), dtype=np.uint16),
+            np.full((4, 5, 6), np.iinfo(np.uint16).max, dtype=np.uint16),
+        ]
+        cls.buffers = [nifti.to_buffer(nib.Nifti1Image(v, np.eye(4))) for v in cls.volumes]
+
+        header = nib.Nifti1Header(endianness=">")
+        big = nib.Nifti1Image(cls.volumes[0].astype(">i2"), np.eye(4), header)
+        cls.volumes.append(cls.volumes[0])
+        cls.buffers.append(nifti.to_buffer(big))
+
+    def test_increment_batch(self):
+        outputs = batch.increment_batch(list(self.buffers))
+
+        for volume, buf in zip(self.volumes, outputs):
+            data = nifti.from_buffer(buf).get_fdata()
+            expected = np.minimum(volume.astype(np.int64) + 1, np.iinfo(np.uint16).max)
+            assert np.array_equal(data, expected)
+
+    def test_scaled(self):
+        im = nib.Nifti1Image(self.volumes[0].astype(np.float32), np.eye(4))
+        im.header.set_slope_inter(2.0, 0)
+        buf = nifti.to_buffer(im)
+        assert batch.layout(nifti.parse_header(buf)) is None
+
+        out = batch.increment_batch([buf])[0]
+        expected = nifti.from_buffer(buf).get_fdata() + 1
+        assert np.allclose(nifti.from_buffer(out).get_fdata(), expected)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+import os
+import fsspec
+import tempfile
+from os import path as op
+from ..src import blockcache, inc, locals3, transfer
+from ..src.offline_bench import dummy_credentials
+
+
+class TestBlockCache:
+    @classmethod
+    def setup_class(cls):
+        cls.fs = fsspec.filesystem("memory")
+        cls.fp = "/testbucket/blocks.bin"
+        cls.data = os.urandom(10 * 1024)
+        cls.fs.pipe_file(cls.fp, cls.data)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fs.rm(cls.fp)
+
+    def tiers(self, *limits):
+        tmp = tempfile.mkdtemp()
+        return [(op.join(tmp, f"tier-{i}"), limit) for i, limit in enumerate(limits)]
+
+    def blocks(self, tier_dir):
+        return [f for f in os.listdir(tier_dir) if f.endswith(blockcache.block_suffix)]
+
+    def test_parse_tiers(self):
+        tiers = blockcache.parse_tiers("/dev/shm/c:1,/tmp/c:0.5")
+        assert tiers == [("/dev/shm/c", 1024 ** 2), ("/tmp/c", 512 * 1024)]
+
+    def test_hits(self):
+        cache = blockcache.BlockCache(self.tiers(64 * 1024))
+
+        for _ in range(2):
+            data = transfer.read_ranges(self.fs, self.fp, 2, 4096, fetch=cache.fetch_range)
+            assert data == self.data
+
+        assert cache.stats == {"hits": 3, "misses": 3, "evictions": 0}
+
+        # a second cache over the same directories shares the blocks
+        shared = blockcache.BlockCache(cache.tiers)
+        shared.fetch_range(self.fs, self.fp, 0, 4096)
+        assert shared.stats["hits"] == 1
+
+    def test_eviction(self):
+        tiers = self.tiers(8 * 1024, 4 * 1024)
+        cache = blockcache.BlockCache(tiers)
+
+        data = transfer.read_ranges(self.fs, self.fp, 1, 2048, fetch=cache.fetch_range)
+        assert data == self.data
+
+        # least recently used blocks are demoted then deleted
+        assert len(self.blocks(tiers[0][0])) == 4
+        assert len(self.blocks(tiers[1][0])) == 1
+        assert cache.stats["evictions"] == 0
+
+        block = cache.fetch_range(self.fs, self.fp, 0, 4096)
+        assert block == self.data[:4096]
+        assert cache.stats["evictions"] == 1
+        assert len(self.blocks(tiers[0][0])) == 3
+        assert len(self.blocks(tiers[1][0])) == 2
+
+    def test_one_head_per_object(self):
+        env = dict(os.environ)
+        os.environ.update(dummy_credentials)
+        requests = []
+        do_head, do_get = locals3.S3Handler.do_HEAD, locals3.S3Handler.do_GET
+
+        def counted(method, name):
+            def _counted(handler):
+                requests.append(name)
+                return method(handler)
+
+            return _counted
+
+        s3 = locals3.LocalS3().start()
+        locals3.S3Handler.do_HEAD = counted(do_head, "HEAD")
+        locals3.S3Handler.do_GET = counted(do_get, "GET")
+        try:
+            s3.create_bucket("testbucket")
+            s3.put_object("testbucket", "blocks.bin", self.data)
+            # the clients module reads3 uses
+            inc.clients.configure(endpoint_url=s3.endpoint_url)
+            cache = blockcache.BlockCache(self.tiers(64 * 1024))
+
+            for _ in range(2):
+                data = inc.reads3(
+                    fp="testbucket/blocks.bin",
+                    anon=False,
+                    cache=False,
+                    parallel_parts=2,
+                    part_size=1280,
+                    block_cache=cache,
+                )
+                assert bytes(data) == self.data
+        finally:
+            locals3.S3Handler.do_HEAD, locals3.S3Handler.do_GET = do_head, do_get
+            s3.stop()
+            inc.clients.reset()
+            os.environ.clear()
+            os.environ.update(env)
+
+        # 8 blocks fetched once, the ETag looked up once per read
+        assert requests.count("HEAD") == 2
+        assert requests.count("GET") == 8
+        assert cache.stats == {"hits": 8, "misses": 8, "evictions": 0}
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+import bz2
+import gzip
+import lzma
+import time
+import dask
+import fsspec
+import numpy as np
+import nibabel as nib
+from io import BytesIO
+from threading import Lock
+from ..src import budget
+
+
+class TestBudget:
+    @classmethod
+    def setup_class(cls):
+        cls.fs = fsspec.filesystem("memory")
+        im = nib.Nifti1Image(np.zeros((20, 30, 40), dtype=np.int16), np.eye(4))
+        im.header.set_data_dtype(np.int16)
+        bio = BytesIO()
+        im.to_file_map(im.make_file_map({"image": bio, "header": bio}))
+
+        cls.raw = len(bio.getvalue())
+        cls.fs.pipe_file("/budget/im.nii", bio.getvalue())
+        cls.fs.pipe_file("/budget/im.nii.gz", gzip.compress(bio.getvalue()))
+        cls.fs.pipe_file("/budget/im.nii.bz2", bz2.compress(bio.getvalue()))
+        cls.fs.pipe_file("/budget/im.nii.xz", lzma.compress(bio.getvalue()))
+        cls.fs.pipe_file("/budget/bad.nii.gz", b"not an image")
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fs.rm("/budget", recursive=True)
+
+    def test_footprint(self):
+        assert budget.raw_size(self.fs, "/budget/im.nii", self.raw) == self.raw
+        assert self.raw == 352 + 20 * 30 * 40 * 2
+
+        size = self.fs.info("/budget/im.nii.gz")["size"]
+        assert budget.footprint(self.fs, "/budget/im.nii.gz") == 2 * size + 3 * self.raw
+
+        # unreadable headers fall back on a fixed expansion ratio
+        assert budget.footprint(self.fs, "/budget/bad.nii.gz") == 2 * 12 + 3 * 4 * 12
+
+    def test_footprints(self):
+        listing = [info for info in self.fs.ls("/budget", detail=True) if "im.nii" in info["name"]]
+        files = [info["name"] for info in listing]
+        sizes = [info["size"] for info in listing]
+
+        # raw sizes decoded from the headers against the real uncompressed images
+        modules = {"nii": None, "gz": gzip, "bz2": bz2, "xz": lzma}
+        for fp, size in zip(files, sizes):
+            data = self.fs.cat_file(fp)
+            module = modules[fp.rsplit(".", 1)[-1]]
+            real = len(module.decompress(data) if module is not None else data)
+            assert budget.raw_size(self.fs, fp, size) == real
+
+        # from the listed sizes, or looked up
+        expected = [2 * size + 3 * self.raw for size in sizes]
+        assert list(budget.footprints(self.fs, files, sizes, workers=4)) == expected
+        assert list(budget.footprints(self.fs, files, workers=4)) == expected
+
+    def test_admission(self):
+        lock = Lock()
+        running = []
+        peak = [0]
+
+        def work(k):
+            with lock:
+                running.append(k)
+                peak[0] = max(peak[0], len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(k)
+            return k
+
+        tasks = [dask.delayed(work)(k) for k in range(6)]
+
+        # two tasks fit at a time, the oversized one runs alone
+        mb = budget.MemoryBudget(100)
+        assert mb.compute(tasks, [50, 50, 50, 50, 500, 10], workers=4) == list(range(6))
+        assert peak[0] == 2
+        assert mb.peak == 500
+        assert mb.used == 0
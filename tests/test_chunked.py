@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+import os
+import fsspec
+import numpy as np
+import nibabel as nib
+from io import BytesIO
+from ..src import chunked, clients
+from ..src.locals3 import LocalS3
+from ..src.offline_bench import dummy_credentials
+
+
+class TestChunked:
+    @classmethod
+    def setup_class(cls):
+        cls.fs = fsspec.filesystem("memory")
+        cls.fp = "/testbucket/randdata.nii"
+        cls.data = np.random.randint(100, size=(20, 30, 40, 5), dtype=np.uint16)
+
+        im = nib.Nifti1Image(cls.data, np.eye(4))
+        bio = BytesIO()
+        im.to_file_map(im.make_file_map({"image": bio, "header": bio}))
+        cls.fs.pipe_file(cls.fp, bio.getvalue())
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fs.rm(cls.fp)
+
+    def test_chunk_bounds(self):
+        header, prefix = chunked.read_header(self.fs, self.fp)
+        slab = chunked.slab_size(header)
+
+        assert len(prefix) == int(header["vox_offset"])
+        assert chunked.chunk_bounds(header, 2 * slab) == [(0, 2), (2, 4), (4, 5)]
+
+    def test_from_s3(self):
+        header, _ = chunked.read_header(self.fs, self.fp)
+        arr = chunked.from_s3(self.fs, self.fp, header, chunk_size=1)
+
+        assert arr.numblocks[-1] == 5
+        assert np.array_equal((arr + 1).compute(), self.data + 1)
+
+    def round_trip(self, endianness):
+        data = np.random.randint(0, 1000, size=(12, 10, 8, 3)).astype(f"{endianness}i2")
+        data[0, 0, 0, 0] = np.iinfo(np.int16).max
+
+        header = nib.Nifti1Header(endianness=endianness)
+        header.set_data_dtype(data.dtype)
+        im = nib.Nifti1Image(data, np.eye(4), header)
+        bio = BytesIO()
+        im.to_file_map(im.make_file_map({"image": bio, "header": bio}))
+
+        env = dict(os.environ)
+        os.environ.update(dummy_credentials)
+        try:
+            with LocalS3() as s3:
+                s3.create_bucket("testbucket")
+                clients.configure(endpoint_url=s3.endpoint_url)
+                fs = clients.get_fs()
+
+                s3.put_object("testbucket", "in.nii", bio.getvalue())
+                chunked.increment(fs, "testbucket/in.nii", "testbucket/out.nii", part_size=1920)
+                out = nib.Nifti1Image.from_bytes(s3.get_object("testbucket", "out.nii")[0])
+        finally:
+            clients.reset()
+            os.environ.clear()
+            os.environ.update(env)
+
+        assert out.header.endianness == endianness
+        assert np.array_equal(out.get_fdata(), np.minimum(data.astype(np.int64) + 1, 32767))
+
+    def test_increment_little_endian(self):
+        self.round_trip("<")
+
+    def test_increment_big_endian(self):
+        self.round_trip(">")
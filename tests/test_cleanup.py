@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+import os
+import tempfile
+from os import path as op
+from ..src import cleanup, helpers
+from ..src.cleanup import Cleaner, clear_prefix, delete_batch
+from ..src.locals3 import LocalS3
+from ..src.offline_bench import dummy_credentials
+
+
+class TestCleanup:
+    @classmethod
+    def setup_class(cls):
+        cls.env = dict(os.environ)
+        os.environ.update(dummy_credentials)
+
+        cls.s3 = LocalS3().start()
+        # the clients module the cleanup functions use
+        cleanup.clients.configure(endpoint_url=cls.s3.endpoint_url)
+        cls.fs = cleanup.clients.get_fs()
+        cls.out_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.s3.stop()
+        cleanup.clients.reset()
+        os.environ.clear()
+        os.environ.update(cls.env)
+
+    def fill(self, prefix, n):
+        self.s3.create_bucket("outputs")
+        for i in range(n):
+            self.s3.put_object("outputs", f"{prefix}/inc_{i}.nii.gz", b"x")
+
+    def test_clear_prefix(self):
+        self.fill("bench_a", 2 * delete_batch + 10)
+        self.fill("bench_ab", 3)
+
+        assert clear_prefix(self.fs, "outputs/bench_a") == 2 * delete_batch + 10
+        assert sorted(self.s3.buckets["outputs"]) == [f"bench_ab/inc_{i}.nii.gz" for i in range(3)]
+        assert clear_prefix(self.fs, "outputs/bench_a") == 0
+
+    def test_background(self):
+        local = op.join(self.out_dir, "local")
+        os.makedirs(local)
+        open(op.join(local, "inc_0_sub-01.nii.gz"), "w").close()
+        self.fill("bench_b", 5)
+
+        bfile = op.join(self.out_dir, "benchmark_b.csv")
+        helpers.setup_bench(bfile)
+
+        cleaner = Cleaner(workers=2, background=True)
+        cleaner.clear([("outputs/bench_b", bfile), (f"file://{local}", bfile)])
+        cleaner.wait("outputs/bench_b")
+        cleaner.shutdown()
+
+        assert not any(k.startswith("bench_b/") for k in self.s3.buckets["outputs"])
+        assert not op.exists(local)
+
+        with open(bfile) as f:
+            rows = [line.split(",") for line in f.readlines()[1:]]
+        assert sorted(r[1] for r in rows if r[0] == "cleanup_end") == [
+            f"file://{local}",
+            "outputs/bench_b",
+        ]
+
+    def test_remote_local_outputs(self):
+        # a stand-in ssh running the command here and logging it
+        bin_dir = tempfile.mkdtemp()
+        log = op.join(bin_dir, "ssh.log")
+        with open(op.join(bin_dir, "ssh"), "w") as f:
+            f.write(f'#!/bin/sh\nshift\necho "$*" >> {log}\nexec sh -c "$*"\n')
+        os.chmod(op.join(bin_dir, "ssh"), 0o755)
+
+        out_dir = op.join(self.out_dir, "host-outputs")
+        os.makedirs(out_dir)
+        bfile = op.join(self.out_dir, "remote.csv")
+        helpers.setup_bench(bfile)
+
+        path = os.environ["PATH"]
+        os.environ["PATH"] = f"{bin_dir}:{path}"
+        try:
+            Cleaner(workers=2).clear([(f"file:/{out_dir}", bfile)], host="worker-1")
+        finally:
+            os.environ["PATH"] = path
+
+        assert not op.exists(out_dir)
+        assert open(log).read() == f"rm -rf {out_dir}\n"
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from ..src import clients, locals3
+from ..src.locals3 import LocalS3
+from ..src.offline_bench import dummy_credentials
+from ..src.transfer import fetch_range
+
+
+class TestClients:
+    @classmethod
+    def setup_class(cls):
+        cls.env = dict(os.environ)
+        os.environ.update(dummy_credentials)
+
+        # every request is slow enough for concurrent ones to overlap
+        cls.s3 = LocalS3(latency=0.05).start()
+        cls.s3.create_bucket("testbucket")
+        cls.s3.put_object("testbucket", "data", os.urandom(1024))
+
+    @classmethod
+    def teardown_class(cls):
+        cls.s3.stop()
+        clients.reset()
+        os.environ.clear()
+        os.environ.update(cls.env)
+
+    def setup_method(self):
+        clients.reset()
+        clients.configure(endpoint_url=self.s3.endpoint_url)
+
+    def test_reuse(self):
+        fs = clients.get_fs()
+        assert clients.get_fs() is fs
+        assert clients.get_fs(anon=True) is not fs
+
+        clients.configure(max_pool=3)
+        small = clients.get_fs()
+        assert small is not fs
+        assert small.s3.meta.config.max_pool_connections == 3
+
+        clients.configure(max_pool=10)
+        assert clients.get_fs() is fs
+        assert clients.stats == {"opened": 3, "reused": 2}
+
+    def test_max_pool(self):
+        active = [0, 0]
+        lock = Lock()
+        do_get = locals3.S3Handler.do_GET
+
+        def counted(handler):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            try:
+                return do_get(handler)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        clients.configure(max_pool=2)
+        fs = clients.get_fs()
+        locals3.S3Handler.do_GET = counted
+        try:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                parts = list(
+                    executor.map(lambda i: fetch_range(fs, "testbucket/data", i, i + 1), range(16))
+                )
+        finally:
+            locals3.S3Handler.do_GET = do_get
+
+        assert len(parts) == 16
+        # the requests of 8 threads wait for one of the 2 pooled connections
+        assert active[1] == 2
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+import tempfile
+import numpy as np
+from os import makedirs, path as op
+from click.testing import CliRunner
+from ..src import compare, helpers
+
+
+def write_results(root, durations):
+    for rep, duration in enumerate(durations):
+        rep_fldr = op.join(root, "instance", "conditions-test", f"rep-{rep}")
+        makedirs(rep_fldr)
+        bfile = op.join(rep_fldr, "benchmark_1i_1f.csv")
+        helpers.setup_bench(bfile)
+        helpers.record("read", "bucket/f.nii", 0, int(duration * 10 ** 9), bfile)
+        helpers.merge_bench(bfile)
+
+
+class TestCompare:
+    def test_mann_whitney(self):
+        fast = np.array([1.0, 2.0, 3.0, 4.0, 4.5])
+        slow = fast + 10
+
+        # exact: only one of the 252 orderings puts all slow runs last
+        u, p = compare.mann_whitney(slow, fast)
+        assert u == 25
+        assert np.isclose(p, 1 / 252)
+        assert compare.mann_whitney(fast, slow)[1] == 1.0
+
+        # ties fall back to the normal approximation
+        u, p = compare.mann_whitney(np.repeat(slow, 2), np.repeat(fast, 2))
+        assert u == 100
+        assert p < 0.001
+
+    def test_main(self):
+        baseline, candidate = tempfile.mkdtemp(), tempfile.mkdtemp()
+        write_results(baseline, [1.0, 1.1, 0.9, 1.05, 0.95])
+        write_results(candidate, [2.0, 2.1, 1.9, 2.05, 1.95])
+
+        runner = CliRunner()
+        result = runner.invoke(compare.main, [baseline, candidate, "--workers", "1"])
+        assert result.exit_code == 1
+        assert "REGRESSION instance/conditions-test/benchmark_1i_1f.csv/read" in result.output
+
+        result = runner.invoke(compare.main, [candidate, baseline, "--workers", "1"])
+        assert result.exit_code == 0
+
+    def test_nothing_compared(self):
+        baseline, candidate = tempfile.mkdtemp(), tempfile.mkdtemp()
+        write_results(baseline, [1.0, 1.1, 0.9])
+        write_results(candidate, [2.0, 2.1, 1.9])
+        runner = CliRunner()
+
+        # 3 against 3 runs cannot be significant at 0.05
+        assert compare.smallest_p(3, 3) == 0.05
+        result = runner.invoke(compare.main, [baseline, candidate, "--min_reps", "3"])
+        assert result.exit_code == 2
+        assert "raise --min_reps" in result.output
+
+        # below the default number of repetitions, no stage is compared
+        result = runner.invoke(compare.main, [baseline, candidate, "--workers", "1"])
+        assert result.exit_code == 2
+        assert "0 stages compared" in result.output
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import gzip
+import zlib
 import pytest
 import pathlib
 import numpy as np
@@ -28,6 +29,42 @@ class TestCompression:
         )
         assert _md5(c_data) == self.compressed_md5
 
+    def test_compress_parallel(self):
+        data = open(self.uncompressed_file, "rb").read()
+        block_size = 64 * 1024
+        c_data = mc.compress_parallel(
+            data, mtime=self.mtime, clevel=self.clevel, threads=4, block_size=block_size
+        )
+
+        # one gzip member per block
+        members = 0
+        rest = c_data
+        while len(rest) > 0:
+            d = zlib.decompressobj(wbits=31)
+            d.decompress(rest)
+            rest = d.unused_data
+            members += 1
+
+        assert members == -(-len(data) // block_size)
+        assert _md5(gzip.decompress(c_data)) == self.uncompressed_md5
+
+    def test_measure_speedup(self, tmp_path):
+        data = open(self.uncompressed_file, "rb").read()
+        bfile = str(tmp_path / "bench.csv")
+        mc.setup_bench(bfile)
+
+        serial, parallel = mc.measure_speedup(
+            data, self.mtime, clevel=1, threads=4, block_size=64 * 1024, fp="x", bfile=bfile
+        )
+        mc.merge_bench(bfile)
+
+        rows = [line.split(",") for line in open(bfile).read().splitlines()[1:]]
+        ends = {row[0]: row for row in rows if row[0].endswith("_end")}
+        assert set(ends) == {"compress_serial_l1_end", "compress_parallel_l1_t4_end"}
+        assert float(ends["compress_serial_l1_end"][4]) == pytest.approx(serial)
+        assert float(ends["compress_parallel_l1_t4_end"][4]) == pytest.approx(parallel)
+        assert int(ends["compress_parallel_l1_t4_end"][6]) == len(data)
+
     def test_decompress(self):
         d_data = mc.decompress(open(self.compressed_file, "rb").read())
         assert _md5(d_data) == self.uncompressed_md5
@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+import numpy as np
+from ..src import compressors
+
+
+class TestCompressors:
+    @classmethod
+    def setup_class(cls):
+        cls.data = np.random.randint(100, size=(50, 50, 50), dtype=np.uint16).tobytes()
+
+    def test_codec_for(self):
+        assert compressors.codec_for("bucket/sub-01_dwi.nii.gz").name == "gzip"
+        assert compressors.codec_for("bucket/sub-01_dwi.nii.xz").name == "xz"
+        assert compressors.codec_for("bucket/sub-01_dwi.nii").name == "none"
+
+    def test_roundtrip(self):
+        for codec in compressors.codecs.values():
+            clevel = codec.levels[-1]
+            c_data = codec.compress(self.data, clevel=clevel)
+            assert bytes(codec.decompress(c_data)) == self.data
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+import glob
+import asyncio
+import tempfile
+import numpy as np
+import pytest
+import multiprocessing as mp
+from os import path as op
+from threading import Thread
+from ..src import helpers
+
+
+@helpers.benchmark
+def _task(fp, **kwargs):
+    return fp
+
+
+@helpers.benchmark
+def _transfer(n_bytes, **kwargs):
+    helpers.record_bytes(n_bytes, n_bytes // 4)
+
+
+@helpers.abenchmark
+async def _atransfer(n_bytes, **kwargs):
+    helpers.record_bytes(n_bytes // 4, n_bytes)
+
+
+@helpers.benchmark
+def _allocate(n_bytes, keep=True, **kwargs):
+    # touched, so the pages are resident
+    data = np.ones(n_bytes, dtype=np.uint8)
+    return data if keep is True else None
+
+
+def _record_in_child(bfile):
+    threads = [
+        Thread(target=_task, kwargs={"fp": f"child-{i}", "bfile": bfile}) for i in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+class TestHelpers:
+    @classmethod
+    def setup_class(cls):
+        cls.bfile = op.join(tempfile.mkdtemp(), "benchmark.csv")
+        helpers.setup_bench(cls.bfile)
+
+    def test_merge_bench(self):
+        for i in range(3):
+            _task(fp=f"bucket/file-{i}.nii", bfile=self.bfile)
+
+        # nothing is written until the buffer is flushed
+        assert open(self.bfile).read().count("\n") == 1
+
+        helpers.merge_bench(self.bfile)
+        lines = open(self.bfile).read().splitlines()
+
+        assert lines[0] == helpers.bench_header
+        assert len(lines) == 7
+        assert lines[1].startswith("_task_start,bucket/file-0.nii,")
+        assert len(glob.glob(f"{self.bfile}.*.part")) == 0
+
+    def test_stale_parts(self):
+        bfile = op.join(tempfile.mkdtemp(), "benchmark.csv")
+        # left by a run killed after flushing its buffer
+        with open(f"{bfile}.12345.part", "w") as f:
+            f.write("_task_end,stale,0,12345,1.0,,,,,\n")
+
+        helpers.setup_bench(bfile)
+        _task(fp="fresh", bfile=bfile)
+        helpers.merge_bench(bfile)
+
+        assert "stale" not in open(bfile).read()
+        assert "fresh" in open(bfile).read()
+
+    def test_fork(self):
+        bfile = op.join(tempfile.mkdtemp(), "benchmark.csv")
+        helpers.setup_bench(bfile)
+
+        # buffered in the parent when the child is forked
+        _task(fp="parent", bfile=bfile)
+        proc = mp.get_context("fork").Process(target=_record_in_child, args=(bfile,))
+        proc.start()
+        proc.join()
+        assert proc.exitcode == 0
+
+        helpers.merge_bench(bfile)
+        files = [line.split(",")[1] for line in open(bfile).read().splitlines()[1:]]
+
+        # the child flushed its own rows at exit, without the parent's
+        assert files.count("parent") == 2
+        assert sorted(set(files)) == sorted(f"child-{i}" for i in range(8)) + ["parent"]
+        assert len(files) == 18
+
+    def rows(self, bfile):
+        helpers.merge_bench(bfile)
+        lines = open(bfile).read().splitlines()
+        return [dict(zip(helpers.bench_header.split(","), line.split(","))) for line in lines[1:]]
+
+    def test_throughput(self):
+        bfile = op.join(tempfile.mkdtemp(), "benchmark.csv")
+        helpers.setup_bench(bfile)
+
+        _transfer(8 * 1024 ** 2, fp="sync", bfile=bfile)
+        asyncio.run(_atransfer(8 * 1024 ** 2, fp="async", bfile=bfile))
+        ends = {row["file"]: row for row in self.rows(bfile) if row["action"].endswith("_end")}
+
+        assert (ends["sync"]["bytes_in"], ends["sync"]["bytes_out"]) == ("8388608", "2097152")
+        assert (ends["async"]["bytes_in"], ends["async"]["bytes_out"]) == ("2097152", "8388608")
+        for row in ends.values():
+            # over the larger side of the transfer
+            assert float(row["mbps"]) == pytest.approx(8 / float(row["runtime"]))
+
+    def test_rss_delta(self):
+        bfile = op.join(tempfile.mkdtemp(), "benchmark.csv")
+        helpers.setup_bench(bfile)
+
+        data = _allocate(64 * 1024 ** 2, fp="kept", bfile=bfile)
+        del data
+        # below the peak of the previous call, which the max RSS would hide
+        data = _allocate(32 * 1024 ** 2, fp="again", bfile=bfile)
+        _allocate(32 * 1024 ** 2, keep=False, fp="freed", bfile=bfile)
+        ends = {row["file"]: row for row in self.rows(bfile) if row["action"].endswith("_end")}
+
+        assert int(ends["kept"]["rss_delta_kb"]) >= 60 * 1024
+        assert int(ends["again"]["rss_delta_kb"]) >= 30 * 1024
+        # transient, freed before the call returns
+        assert int(ends["freed"]["rss_delta_kb"]) >= 30 * 1024
+
+        # the per-call resets keep the peak of the run
+        assert helpers.peak_rss() >= int(ends["kept"]["rss_delta_kb"])
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+import tempfile
+from os import listdir
+from ..src.intermediates import IntermediateStore
+
+
+class TestIntermediates:
+    def test_spill(self):
+        spill_dir = tempfile.mkdtemp()
+        store = IntermediateStore(10, spill_dir=spill_dir, spill_limit=10)
+
+        assert store.put("bucket/inc_0_a.nii", b"a" * 8) is True
+        assert store.put("bucket/inc_0_b.nii", b"b" * 8) is True
+        assert store.put("bucket/inc_0_c.nii", b"c" * 8) is False
+        assert len(listdir(spill_dir)) == 1
+
+        assert store.pop("bucket/inc_0_b.nii") == b"b" * 8
+        assert "bucket/inc_0_b.nii" not in store
+        assert len(listdir(spill_dir)) == 0
+
+        store.clear()
+        assert "bucket/inc_0_a.nii" not in store
+
+    def test_spill_failed(self):
+        # the space is given back and the key never listed
+        store = IntermediateStore(0, spill_dir="/nonexistent/spill", spill_limit=10)
+
+        assert store.put("bucket/inc_0_a.nii", b"a" * 8) is False
+        assert "bucket/inc_0_a.nii" not in store
+        assert store.spill_used == 0
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+import os
+import tempfile
+import pytest
+from os import path as op
+from ..src import clients, inc
+from ..src.blockcache import BlockCache
+from ..src.locals3 import LocalS3
+from ..src.manifest import Manifest, pattern_regex, split_pattern
+from ..src.offline_bench import dummy_credentials
+
+
+class TestManifest:
+    @classmethod
+    def setup_class(cls):
+        cls.env = dict(os.environ)
+        os.environ.update(dummy_credentials)
+
+        cls.s3 = LocalS3().start()
+        cls.s3.create_bucket("data")
+        for sub in range(3):
+            cls.s3.put_object("data", f"ds/sub-{sub}/anat/T1w.nii.gz", bytes(10 + sub))
+            cls.s3.put_object("data", f"ds/sub-{sub}/anat/T1w.json", b"{}")
+
+        clients.configure(endpoint_url=cls.s3.endpoint_url)
+        cls.fs = clients.get_fs()
+        # the clients module the reads in inc use
+        inc.clients.configure(endpoint_url=cls.s3.endpoint_url)
+        cls.index_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.s3.stop()
+        clients.reset()
+        inc.clients.reset()
+        os.environ.clear()
+        os.environ.update(cls.env)
+
+    def manifest(self, rgx="data/ds/sub-*/anat/*.nii.gz", refresh=False):
+        return Manifest(self.fs, rgx, self.index_dir).open(refresh=refresh)
+
+    def test_pattern(self):
+        assert split_pattern("s3://data/ds/sub-*/anat/*.nii.gz") == ("data", "ds/")
+        assert split_pattern("data/ds/sub-01/anat/T1w.nii.gz") == (
+            "data",
+            "ds/sub-01/anat/T1w.nii.gz",
+        )
+
+        regex = pattern_regex("data/ds/sub-*/anat/*.nii.gz")
+        assert regex.match("data/ds/sub-01/anat/T1w.nii.gz")
+        assert not regex.match("data/ds/sub-01/ses-1/anat/T1w.nii.gz")
+        assert pattern_regex("data/ds/**.nii.gz").match("data/ds/sub-01/ses-1/anat/T1w.nii.gz")
+
+    def test_refresh(self):
+        m = self.manifest()
+        m.close()
+        assert m.files() == sorted(self.fs.glob("data/ds/sub-*/anat/*.nii.gz"))
+        assert m.size("data/ds/sub-1/anat/T1w.nii.gz") == 11
+
+        # keys added before and after the others, overwritten or deleted
+        self.s3.put_object("data", "ds/sub-00/anat/T1w.nii.gz", bytes(9))
+        self.s3.put_object("data", "ds/sub-3/anat/T1w.nii.gz", bytes(13))
+        self.s3.put_object("data", "ds/sub-1/anat/T1w.nii.gz", bytes(20))
+        self.s3.delete_object("data", "ds/sub-2/anat/T1w.nii.gz")
+
+        # with an index, only the keys after the last indexed one are listed
+        m = self.manifest()
+        m.close()
+        assert m.stats["list_requests"] == 1
+        assert m.stats["changed"] == 1
+        assert "data/ds/sub-3/anat/T1w.nii.gz" in m
+        assert "data/ds/sub-00/anat/T1w.nii.gz" not in m
+        assert m.size("data/ds/sub-1/anat/T1w.nii.gz") == 11
+
+        # the others on request
+        m = self.manifest(refresh=True)
+        m.close()
+        assert m.stats["changed"] == 3
+        assert m.files() == [
+            "data/ds/sub-0/anat/T1w.nii.gz",
+            "data/ds/sub-00/anat/T1w.nii.gz",
+            "data/ds/sub-1/anat/T1w.nii.gz",
+            "data/ds/sub-3/anat/T1w.nii.gz",
+        ]
+        assert m.size("data/ds/sub-1/anat/T1w.nii.gz") == 20
+
+        m = self.manifest()
+        assert m.stats["changed"] == 0
+        assert m.dirty is False
+
+    def test_changed_after_listing(self):
+        fp = "data/ds/sub-0/anat/T1w.nii.gz"
+        # the manifest class inc catches the errors of
+        m = inc.Manifest(self.fs, "data/ds/sub-*/anat/*.nii.gz", self.index_dir).open()
+        cache = BlockCache([(op.join(self.index_dir, "cache"), 1024 ** 2)])
+
+        def read(**kwargs):
+            return bytes(inc.reads3(fp=fp, anon=False, cache=False, manifest=m, **kwargs))
+
+        # larger than listed, the read is not cut at the listed size
+        grown = bytes(range(250)) * 8
+        self.s3.put_object("data", "ds/sub-0/anat/T1w.nii.gz", grown)
+        assert read() == grown
+        assert m.size(fp) == len(grown)
+
+        # same size, the ranged reads and the block cache see the new content
+        self.s3.put_object("data", "ds/sub-0/anat/T1w.nii.gz", b"A" * len(grown))
+        assert read(parallel_parts=2, part_size=512) == b"A" * len(grown)
+        assert read(block_cache=cache, part_size=512) == b"A" * len(grown)
+
+        # blocks cached under the indexed ETag are served without a request,
+        # a missing one is fetched conditionally and exposes the overwrite
+        self.s3.put_object("data", "ds/sub-0/anat/T1w.nii.gz", b"B" * len(grown))
+        assert read(block_cache=cache, part_size=512) == b"A" * len(grown)
+        assert read(block_cache=cache, part_size=256) == b"B" * len(grown)
+        assert read(readahead=True) == b"B" * len(grown)
+
+        # deleted since the listing: dropped from the manifest
+        self.s3.delete_object("data", "ds/sub-0/anat/T1w.nii.gz")
+        with pytest.raises(FileNotFoundError):
+            read()
+        assert fp not in m
+
+        # the index is written once, when the manifest is closed
+        m.close()
+        assert fp not in inc.Manifest(self.fs, m.rgx, self.index_dir).open()
+
+    def test_prefetch(self):
+        m = self.manifest()
+        files = m.files()
+        m.prefetch(files[:2], workers=2)
+
+        assert m.take(files[0]) == self.s3.get_object(*files[0].split("/", 1))[0]
+        assert m.take(files[0]) is None
+        assert m.take(files[2]) is None
+        m.close()
+        assert m.stats["prefetched"] == 1
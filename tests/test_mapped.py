@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+import os
+import tempfile
+import numpy as np
+import nibabel as nib
+import pytest
+from os import path as op
+from click.testing import CliRunner
+from ..src import inc, mapped
+
+
+class TestMapped:
+    @classmethod
+    def setup_class(cls):
+        cls.tmp = tempfile.mkdtemp()
+
+    def save(self, fn, data, endianness="<"):
+        header = nib.Nifti1Header(endianness=endianness)
+        header.set_data_dtype(data.dtype)
+        fp = op.join(self.tmp, fn)
+        nib.Nifti1Image(data, np.eye(4), header).to_filename(fp)
+        return fp
+
+    def test_increment(self):
+        data = np.random.randint(0, 256, size=(10, 11, 12), dtype=np.uint8)
+        data[0, 0, 0] = 255
+        fp = self.save("u8.nii", data)
+        out_fp = op.join(self.tmp, "u8_out.nii")
+
+        # chunks smaller than a page and not aligned to one
+        assert mapped.increment(fp, out_fp, chunk_size=1000) == op.getsize(out_fp)
+
+        out = np.asanyarray(nib.load(out_fp).dataobj)
+        assert out.dtype == np.uint8
+        assert np.array_equal(out, np.minimum(data.astype(np.int64) + 1, 255))
+
+    def test_big_endian(self):
+        data = np.random.rand(8, 9, 10).astype(np.float32)
+        fp = self.save("be.nii", data, endianness=">")
+        out_fp = op.join(self.tmp, "be_out.nii")
+        mapped.increment(fp, out_fp)
+
+        assert np.allclose(nib.load(out_fp).get_fdata(), data + 1)
+
+    def test_scaled(self):
+        im = nib.Nifti1Image(np.ones((4, 4, 4), dtype=np.int16), np.eye(4))
+        im.header.set_slope_inter(2, 0)
+        fp = op.join(self.tmp, "scaled.nii")
+        im.to_filename(fp)
+
+        with pytest.raises(ValueError):
+            mapped.increment(fp, op.join(self.tmp, "scaled_out.nii"))
+
+    def test_inc(self):
+        data = np.random.randint(0, 100, size=(6, 7, 8), dtype=np.int16)
+        self.save("sub-01_T1w.nii", data)
+        out_dir = op.join(self.tmp, "out")
+        os.makedirs(out_dir)
+
+        result = CliRunner().invoke(
+            inc.main,
+            [
+                f"file://{self.tmp}/sub-*.nii",
+                f"file://{out_dir}",
+                "--it",
+                "2",
+                "--mmap",
+                "--bench_file",
+                op.join(self.tmp, "benchmark_mmap.csv"),
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        out = nib.load(op.join(out_dir, "inc_1_sub-01_T1w.nii")).get_fdata()
+        assert np.array_equal(out, data + 2)
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+import numpy as np
+import nibabel as nib
+from io import BytesIO
+from ..src import nifti
+
+
+def _to_bytes(im):
+    bio = BytesIO()
+    im.to_file_map(im.make_file_map({"image": bio, "header": bio}))
+    return bio.getvalue()
+
+
+class TestNifti:
+    @classmethod
+    def setup_class(cls):
+        cls.data = np.random.randint(100, size=(20, 30, 40), dtype=np.uint16)
+
+    def test_image_from_buffer(self):
+        buf = bytearray(_to_bytes(nib.Nifti1Image(self.data, np.eye(4))))
+        im = nifti.image_from_buffer(buf)
+
+        data = np.asanyarray(im.dataobj)
+        assert np.array_equal(data, self.data)
+        assert np.shares_memory(data, np.frombuffer(buf, dtype=np.uint8))
+
+    def test_big_endian(self):
+        header = nib.Nifti1Header(endianness=">")
+        im = nib.Nifti1Image(self.data.astype(">i2"), np.eye(4), header)
+        im = nifti.image_from_buffer(_to_bytes(im))
+
+        assert np.array_equal(np.asanyarray(im.dataobj), self.data)
+
+    def test_scaling(self):
+        im = nib.Nifti1Image(self.data, np.eye(4))
+        im.header.set_slope_inter(2, 1)
+        im = nifti.image_from_buffer(_to_bytes(im))
+
+        assert np.array_equal(np.asanyarray(im.dataobj), self.data * 2 + 1)
+
+    def test_saturating_add(self):
+        data = np.array([0, 254, 255], dtype=np.uint8)
+        assert np.array_equal(nifti.saturating_add(data), [1, 255, 255])
+
+        nifti.saturating_add(data, out=data)
+        assert np.array_equal(data, [1, 255, 255])
+        assert nifti.saturating_add(np.array([1.5], dtype=">f4"))[0] == 2.5
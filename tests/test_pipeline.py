@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+import os
+import tempfile
+import numpy as np
+import nibabel as nib
+from os import path as op
+from click.testing import CliRunner
+from ..src import clients, compressors, inc, nifti
+from ..src.locals3 import LocalS3
+from ..src.offline_bench import dummy_credentials, seed
+
+
+class TestPipeline:
+    @classmethod
+    def setup_class(cls):
+        cls.env = dict(os.environ)
+        os.environ.update(dummy_credentials)
+
+        cls.s3 = LocalS3().start()
+        cls.keys = seed(cls.s3, "inputs", ["16x16x16"], 2, suffix=".nii.gz")
+        cls.raw_keys = seed(cls.s3, "raw", ["16x16x16"], 2, suffix=".nii", dtype=np.int16)
+
+        # uncompressed inputs stored big-endian
+        for key in cls.raw_keys:
+            bucket, fn = key.split("/")
+            im = nifti.from_buffer(cls.s3.get_object(bucket, fn)[0])
+            header = nib.Nifti1Header(endianness=">")
+            header.set_data_dtype(">i2")
+            data = np.asanyarray(im.dataobj).astype(">i2")
+            cls.s3.put_object(bucket, fn, nifti.to_buffer(nib.Nifti1Image(data, np.eye(4), header)))
+        cls.out_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.s3.stop()
+        clients.reset()
+        os.environ.clear()
+        os.environ.update(cls.env)
+
+    def run_inc(self, name, *args, bucket="inputs"):
+        self.s3.buckets.pop("outputs", None)
+        self.s3.create_bucket("outputs")
+
+        result = CliRunner().invoke(
+            inc.main,
+            [
+                f"{bucket}/*",
+                "outputs",
+                "--n_files",
+                "2",
+                "--it",
+                "2",
+                "--bench_file",
+                op.join(self.out_dir, f"benchmark_{name}.csv"),
+                "--endpoint_url",
+                self.s3.endpoint_url,
+                *args,
+            ],
+        )
+        assert result.exit_code == 0, result.output
+
+        for key in self.raw_keys if bucket == "raw" else self.keys:
+            bucket, fn = key.split("/")
+            out_key = f"inc_1_{fn}"
+            codec = compressors.codec_for(fn)
+            inputs = codec.decompress(self.s3.get_object(bucket, fn)[0])
+            outputs = codec.decompress(self.s3.get_object("outputs", out_key)[0])
+
+            expected = nifti.from_buffer(inputs).get_fdata() + 2
+            assert np.array_equal(nifti.from_buffer(outputs).get_fdata(), expected)
+
+    def test_sequential(self):
+        self.run_inc("sequential")
+
+    def test_multipart(self):
+        self.run_inc("multipart", "--parallel_parts", "3", "--stream")
+
+    def test_manifest(self):
+        manifest_dir = op.join(self.out_dir, "manifest")
+        self.run_inc("manifest", "--manifest_dir", manifest_dir, "--prefetch", "1")
+        self.run_inc("manifest", "--manifest_dir", manifest_dir, "--parallel_parts", "2")
+
+        # streamed reads inflate the prefetched objects instead of downloading them again
+        self.run_inc("prefetch_stream", "--manifest_dir", manifest_dir, "--prefetch", "2", "--stream")
+        with open(op.join(self.out_dir, "manifest.csv")) as f:
+            row = [r for r in f.read().splitlines() if r.startswith("benchmark_prefetch_stream")]
+        assert row[-1].split(",")[4] == "2"
+
+    def test_keep_intermediates(self):
+        # in memory, then spilled to /dev/shm with no memory left
+        self.run_inc("intermediates", "--keep_intermediates")
+        self.run_inc("spilled", "--keep_intermediates", "--mem_limit", "0", "--spill_limit", "1")
+
+        # only the last iteration is written out
+        keys = [key for key, _ in self.s3.list_objects("outputs")[0]]
+        assert len(keys) == 2 and all(key.startswith("inc_1_") for key in keys)
+
+    def test_mem_budget(self):
+        # one file at a time fits in 1MB, peak RSS is recorded next to the makespans
+        self.run_inc("budget", "--use_dask", "--mem_budget", "1")
+
+        with open(op.join(self.out_dir, "peak_rss.csv")) as f:
+            row = [r for r in f.read().splitlines() if r.startswith("benchmark_budget.csv")][-1]
+        name, peak_kb, mem_budget, peak_admitted = row.split(",")
+        assert int(peak_kb) > 0 and mem_budget == "1" and int(peak_admitted) > 0
+
+    def test_chunked(self):
+        # big-endian volumes stay big-endian
+        self.run_inc("chunked", "--chunked", "--part_size", "4096", bucket="raw")
+
+    def test_batch(self):
+        self.run_inc("batch", "--batch_size", "2")
+
+    def test_asyncio(self):
+        self.run_inc("asyncio", "--engine", "asyncio", "--max_inflight", "2")
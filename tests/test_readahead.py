@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+import os
+import fsspec
+from ..src import readahead
+
+
+class TestReadahead:
+    @classmethod
+    def setup_class(cls):
+        cls.fs = fsspec.filesystem("memory")
+        cls.fp = "/testbucket/readahead.bin"
+        cls.data = os.urandom(3 * readahead.min_block_size + 123)
+        cls.fs.pipe_file(cls.fp, cls.data)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fs.rm(cls.fp)
+
+    def test_sequential(self):
+        with readahead.PrefetchFile(self.fs, self.fp, block_size=1) as f:
+            out = bytearray()
+            while True:
+                chunk = f.read(256 * 1024)
+                if not chunk:
+                    break
+                out += chunk
+
+            assert out == self.data
+            assert f.stats["resets"] == 0
+            # the block size never drops below the minimum
+            assert f.stats["requests"] <= 4
+
+    def test_random(self):
+        with readahead.PrefetchFile(self.fs, self.fp) as f:
+            assert f.read() == self.data
+
+            f.seek(1000)
+            assert f.read(10) == self.data[1000:1010]
+            assert f.read(10) == self.data[1010:1020]
+            n = 2 * readahead.min_block_size
+            assert f.read(n) == self.data[1020 : 1020 + n]
+
+            f.seek(-5, os.SEEK_END)
+            assert f.read(100) == self.data[-5:]
+            assert f.read(100) == b""
+            # the end of the file is already held by the readahead
+            assert f.stats["resets"] == 1
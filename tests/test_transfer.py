@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+import os
+import gzip
+import fsspec
+import numpy as np
+from ..src import inc, transfer as tr
+from ..src.locals3 import LocalS3
+from ..src.offline_bench import dummy_credentials
+
+
+class TestTransfer:
+    @classmethod
+    def setup_class(cls):
+        cls.fs = fsspec.filesystem("memory")
+        cls.fp = "/testbucket/randdata.out"
+        cls.data = np.random.bytes(3 * 1024 ** 2 + 17)
+        cls.fs.pipe_file(cls.fp, cls.data)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fs.rm(cls.fp)
+
+    def test_part_ranges(self):
+        ranges = tr.part_ranges(10, 4)
+        assert ranges == [(0, 4), (4, 8), (8, 10)]
+
+    def test_read_ranges(self):
+        data = tr.read_ranges(self.fs, self.fp, 4, part_size=1024 ** 2)
+        assert bytes(data) == self.data
+
+    def test_read_gzip_stream(self):
+        fp = "/testbucket/randdata.out.gz"
+        # two concatenated members, the trailer only describes the last one
+        self.fs.pipe_file(fp, gzip.compress(self.data[:1000]) + gzip.compress(self.data[1000:]))
+
+        data = tr.read_gzip_stream(self.fs, fp, 4, part_size=1024 ** 2)
+        assert bytes(data) == self.data
+        self.fs.rm(fp)
+
+    def test_buffer_reader(self):
+        f = tr.BufferReader(bytearray(self.data))
+        assert f.read(10) == self.data[:10]
+        f.seek(-5, 2)
+        assert f.read() == self.data[-5:]
+        assert f.read(10) == b""
+
+
+class TestMultipartWriter:
+    @classmethod
+    def setup_class(cls):
+        cls.env = dict(os.environ)
+        os.environ.update(dummy_credentials)
+
+        cls.s3 = LocalS3().start()
+        cls.s3.create_bucket("testbucket")
+        # the clients module writes3 uses
+        inc.clients.configure(endpoint_url=cls.s3.endpoint_url)
+        cls.fs = inc.clients.get_fs()
+        # three full parts and a smaller final one
+        cls.data = np.random.bytes(3 * tr.MultipartWriter.min_part_size + 1234)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.s3.stop()
+        inc.clients.reset()
+        os.environ.clear()
+        os.environ.update(cls.env)
+
+    def test_write(self):
+        uploads = self.s3.n_uploads
+        with tr.MultipartWriter(self.fs, "testbucket/parts.out", 4, part_size=1) as f:
+            # writes smaller than a part fill it up across calls
+            for i in range(0, len(self.data), 3 * 1024 ** 2):
+                f.write(self.data[i : i + 3 * 1024 ** 2])
+
+        assert len(f.parts) == 4
+        assert self.s3.n_uploads == uploads + 1
+        assert self.s3.get_object("testbucket", "parts.out")[0] == self.data
+
+    def test_writes3(self):
+        uploads = self.s3.n_uploads
+        inc.writes3("testbucket/writes3.out", self.data, cache=False, parallel_parts=4)
+        assert self.s3.n_uploads == uploads + 1
+        assert self.s3.get_object("testbucket", "writes3.out")[0] == self.data
+
+        # a single part is put as a plain object
+        inc.writes3("testbucket/small.out", self.data[:1000], cache=False, parallel_parts=4)
+        assert self.s3.n_uploads == uploads + 1
+        assert self.s3.get_object("testbucket", "small.out")[0] == self.data[:1000]
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+import fsspec
+import numpy as np
+from io import BytesIO
+from nibabel.streamlines import Tractogram, TrkFile
+from ..src import trk
+
+
+class TestTrk:
+    @classmethod
+    def setup_class(cls):
+        rng = np.random.default_rng(0)
+        n_points = rng.integers(1, 50, size=200)
+        streamlines = [rng.random((n, 3), dtype=np.float32) * 10 for n in n_points]
+
+        tractogram = Tractogram(
+            streamlines,
+            data_per_point={"fa": [rng.random((n, 1), dtype=np.float32) for n in n_points]},
+            data_per_streamline={"length": n_points[:, None].astype(np.float32)},
+            affine_to_rasmm=np.eye(4),
+        )
+
+        bio = BytesIO()
+        TrkFile(tractogram).save(bio)
+
+        cls.fs = fsspec.filesystem("memory")
+        cls.fp = "/testbucket/tracks.trk"
+        cls.fs.pipe_file(cls.fp, bio.getvalue())
+        cls.expected = TrkFile.load(BytesIO(bio.getvalue())).tractogram
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fs.rm(cls.fp)
+
+    def test_iter_batches(self):
+        # small chunks and buffers to split records across chunks and batches
+        points, fa, lengths = [], [], []
+        for batch in trk.iter_batches(self.fs, self.fp, chunk_size=1000, max_points=64):
+            for i in range(len(batch.offsets) - 1):
+                start, end = batch.offsets[i], batch.offsets[i + 1]
+                points.append(batch.points[start:end].copy())
+                fa.append(batch.scalars[start:end].copy())
+            lengths.append(batch.properties)
+
+        assert len(points) == len(self.expected.streamlines)
+        for p, e in zip(points, self.expected.streamlines):
+            assert np.allclose(p, e, atol=1e-5)
+        for s, e in zip(fa, self.expected.data_per_point["fa"]):
+            assert np.allclose(s, e)
+        assert np.array_equal(np.concatenate(lengths), self.expected.data_per_streamline["length"])
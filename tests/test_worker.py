@@ -0,0 +1,35 @@
+#!/usr/bin/env python
+import tempfile
+from os import path as op
+from threading import Thread
+from ..src import worker
+
+
+class TestWorker:
+    @classmethod
+    def setup_class(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.socket_path = op.join(cls.tmp, "worker.sock")
+        cls.worker = worker.Worker(cls.socket_path, startup=0)
+        cls.thread = Thread(target=cls.worker.serve, daemon=True)
+        cls.thread.start()
+
+    @classmethod
+    def teardown_class(cls):
+        worker.submit(cls.socket_path, {"cmd": "shutdown"}, timeout=10)
+        cls.thread.join(10)
+
+    def test_jobs(self):
+        bfile = op.join(self.tmp, "benchmark.csv")
+        out = worker.submit(self.socket_path, {"argv": ["--help", "--bench_file", bfile]})
+        assert out["returncode"] == 0
+        assert "Usage: inc" in out["output"]
+
+        # bad arguments fail the job, not the worker
+        out = worker.submit(self.socket_path, {"argv": ["--it", "nan"]}, timeout=10)
+        assert out["returncode"] == 2
+
+        rows = open(bfile).read()
+        assert "worker_imports_end" in rows
+        assert "worker_reset_end" in rows
+        assert self.worker.jobs == 2